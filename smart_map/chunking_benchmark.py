@@ -0,0 +1,110 @@
+"""Benchmark of chunking throughput and memory.
+
+    python -m smart_map.chunking_benchmark --pages 400 --chunk-size 300
+
+Chunks a synthetic document of policy-like pages with chunk_file, serially and
+across worker processes, and reports pages per second and the peak memory
+allocated by this process for each mode. Memory is traced in a separate, untimed
+run, and does not include the worker processes.
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+from langchain.docstore.document import Document
+
+import smart_map.core.chunking as chunking
+from smart_map.core.parsing import File, TxtFile
+
+_WORDS = (
+    "the insured shall notify insurer within thirty days of any claim loss damage"
+    " policy coverage premium deductible liability endorsement exclusion period"
+    " property vehicle schedule limit occurrence aggregate benefit beneficiary"
+).split()
+
+
+def synthetic_pages(pages: int, lines: int = 40, seed: int = 0) -> List[Document]:
+    """Pages of numbered clauses, shaped like the text PdfFile extracts"""
+    rng = random.Random(seed)
+    docs = []
+    for page in range(pages):
+        text = "\n".join(
+            f"{page + 1}.{line + 1} "
+            + " ".join(rng.choice(_WORDS) for _ in range(rng.randint(8, 24)))
+            for line in range(lines)
+        )
+        docs.append(Document(page_content=text, metadata={"page": page + 1}))
+    return docs
+
+
+def measure(
+    docs: List[Document], chunk_size: int, chunk_overlap: int, parallel: bool
+) -> Dict[str, Any]:
+    file = TxtFile(name="benchmark.txt", id="benchmark", docs=docs)
+
+    def chunk() -> File:
+        chunks = chunking.iter_chunks(
+            file.docs, chunk_size, chunk_overlap, parallel=parallel
+        )
+        return file.with_docs(list(chunks))
+
+    started = time.perf_counter()
+    chunked = chunk()
+    elapsed = time.perf_counter() - started
+    del chunked
+    tracemalloc.start()
+    chunked = chunk()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "mode": "parallel" if parallel else "serial",
+        "pages": len(docs),
+        "chunks": len(chunked.docs),
+        "seconds": elapsed,
+        "pages_per_second": len(docs) / elapsed,
+        "peak_bytes": peak,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--lines", type=int, default=40, help="lines per page")
+    parser.add_argument("--chunk-size", type=int, default=300)
+    parser.add_argument("--chunk-overlap", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="print the full report")
+    args = parser.parse_args()
+
+    chunking.CHUNK_WORKERS = args.workers
+    docs = synthetic_pages(args.pages, args.lines)
+    # Builds the tokenizers and starts the workers before anything is timed
+    for _ in chunking.iter_chunks(
+        docs, args.chunk_size, args.chunk_overlap, parallel=True
+    ):
+        pass
+
+    report = [
+        measure(docs, args.chunk_size, args.chunk_overlap, parallel)
+        for parallel in (False, True)
+    ]
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(
+        f"{'mode':>8} {'pages':>6} {'chunks':>7} {'seconds':>8}"
+        f" {'pages/s':>8} {'peak MB':>8}"
+    )
+    for row in report:
+        print(
+            f"{row['mode']:>8} {row['pages']:>6} {row['chunks']:>7}"
+            f" {row['seconds']:>8.2f} {row['pages_per_second']:>8.1f}"
+            f" {row['peak_bytes'] / 1024**2:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
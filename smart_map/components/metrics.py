@@ -0,0 +1,32 @@
+import streamlit as st
+
+from smart_map.core.bounded_cache import CACHES
+from smart_map.core.frames import format_nbytes
+from smart_map.core.session_store import current_session
+
+
+def metrics():
+    with st.expander("Metrics"):
+        st.markdown("#### Caches")
+        for name, cache in CACHES.items():
+            stats = cache.stats
+            lookups = stats.hits + stats.misses
+            hit_rate = f"{stats.hits / lookups:.0%}" if lookups else "-"
+            st.markdown(
+                f"**{name}**: {stats.entries} entries,"
+                f" {format_nbytes(stats.nbytes)}\n\n"
+                f"hits {stats.hits} · misses {stats.misses} ({hit_rate} hit rate)"
+                f" · evictions {stats.evictions} · expirations {stats.expirations}"
+            )
+
+        st.markdown("#### Sessions")
+        session = current_session()
+        stats = session.store.stats
+        st.markdown(
+            f"{stats.sessions} sessions · {format_nbytes(stats.resident_bytes)}"
+            f" in memory · {format_nbytes(stats.spilled_bytes)} spilled to disk\n\n"
+            f"spills {stats.spills} · reloads {stats.reloads}"
+            f" · idle sessions evicted {stats.evicted_sessions}\n\n"
+            "This session:"
+            f" {format_nbytes(session.store.session_nbytes(session.session_id))}"
+        )
@@ -1,6 +1,7 @@
 import streamlit as st
 
 from smart_map.components.faq import faq
+from smart_map.components.metrics import metrics
 from dotenv import load_dotenv
 import os
 
@@ -34,6 +35,12 @@ def sidebar():
         
         st.session_state.model = model
 
+        st.session_state.compact_frames = st.checkbox(
+            "Compact memory mode",
+            help="Store uploaded tables with downcast numbers, categorical and"
+            " Arrow strings, shared between sessions.",
+        )
+
         st.markdown("---")
         st.markdown("# About")
         st.markdown(
@@ -44,4 +51,6 @@ def sidebar():
         st.markdown("Made by Theo Mefford")
         st.markdown("---")
 
+        metrics()
+
         faq()
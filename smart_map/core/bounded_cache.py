@@ -0,0 +1,254 @@
+import functools
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from hashlib import md5
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class CachePolicy:
+    """Limits for a BoundedCache. None disables the corresponding limit."""
+
+    max_entries: Optional[int] = 32
+    max_bytes: Optional[int] = 256 * 1024**2
+    ttl: Optional[float] = 60 * 60
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    entries: int = 0
+    nbytes: int = 0
+
+
+def estimate_nbytes(value: Any, _depth: int = 0) -> int:
+    """Rough resident size of a cached value in bytes.
+
+    Objects that know their own size, such as arrays and FolderIndex, report it
+    through an integer `nbytes` attribute. Memory-mapped arrays are not counted,
+    as they are paged in from disk.
+    """
+    if _depth > 3:
+        return sys.getsizeof(value)
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, np.memmap):
+        return sys.getsizeof(value)
+    if isinstance(value, (str, bytes, bytearray)):
+        return sys.getsizeof(value)
+    if hasattr(value, "getbuffer"):
+        # In-memory uploads, whose contents are not in their __dict__
+        try:
+            with value.getbuffer() as buffer:
+                return sys.getsizeof(value) + buffer.nbytes
+        except ValueError:  # Closed
+            return sys.getsizeof(value)
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(
+            estimate_nbytes(v, _depth + 1) for v in value
+        )
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            estimate_nbytes(v, _depth + 1) for v in value.values()
+        )
+    if hasattr(value, "page_content"):
+        return sys.getsizeof(value.page_content) + sys.getsizeof(value.metadata)
+    if hasattr(value, "__dict__"):
+        return sys.getsizeof(value) + estimate_nbytes(vars(value), _depth + 1)
+    return sys.getsizeof(value)
+
+
+class BoundedCache:
+    """Thread-safe LRU cache bounded by entry count, total size in bytes and age"""
+
+    def __init__(self, name: str, policy: Optional[CachePolicy] = None):
+        self.name = name
+        self.policy = policy or CachePolicy()
+        self.stats = CacheStats()
+        # key -> (value, nbytes, inserted_at), least recently used first
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int, float]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Returns (found, value), counting the lookup as a hit or miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                self._remove(key)
+                self.stats.expirations += 1
+                entry = None
+            if entry is None:
+                self.stats.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return True, entry[0]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        nbytes = estimate_nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            max_bytes = self.policy.max_bytes
+            if max_bytes is not None and nbytes > max_bytes:
+                # Never cache a value that would evict everything else
+                return
+            self._entries[key] = (value, nbytes, time.monotonic())
+            self.stats.entries += 1
+            self.stats.nbytes += nbytes
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.stats.entries = 0
+            self.stats.nbytes = 0
+
+    def _expired(self, entry: Tuple[Any, int, float]) -> bool:
+        ttl = self.policy.ttl
+        return ttl is not None and time.monotonic() - entry[2] > ttl
+
+    def _remove(self, key: Hashable) -> None:
+        _, nbytes, _ = self._entries.pop(key)
+        self.stats.entries -= 1
+        self.stats.nbytes -= nbytes
+
+    def _evict(self) -> None:
+        max_entries, max_bytes = self.policy.max_entries, self.policy.max_bytes
+        for key in [k for k, e in self._entries.items() if self._expired(e)]:
+            self._remove(key)
+            self.stats.expirations += 1
+        while self._entries and (
+            (max_entries is not None and len(self._entries) > max_entries)
+            or (max_bytes is not None and self.stats.nbytes > max_bytes)
+        ):
+            self._remove(next(iter(self._entries)))
+            self.stats.evictions += 1
+
+
+# All caches created through `cached`, by name, for the metrics panel
+CACHES: Dict[str, BoundedCache] = {}
+
+_HASH_ATTR = "_smart_map_content_hash"
+_upload_hashes: "OrderedDict[Hashable, str]" = OrderedDict()
+_MAX_UPLOAD_HASHES = 1024
+_HASH_BLOCK_BYTES = 1024**2
+
+
+def _stream_md5(file: Any) -> str:
+    """md5 of a file's contents in a single pass, hashing in-memory uploads in
+    place and reading anything else in blocks"""
+    digest = md5()
+    if hasattr(file, "getbuffer"):
+        with file.getbuffer() as buffer:
+            digest.update(buffer)
+        return digest.hexdigest()
+    position = file.tell()
+    file.seek(0)
+    for block in iter(lambda: file.read(_HASH_BLOCK_BYTES), b""):
+        digest.update(block)
+    file.seek(position)
+    return digest.hexdigest()
+
+
+def _upload_id(file: Any) -> Optional[Hashable]:
+    """Identifies an upload across reruns: `id` on Streamlit up to 1.26, and
+    `file_id` on later versions"""
+    file_id = getattr(file, "id", None)
+    if file_id is None:
+        file_id = getattr(file, "file_id", None)
+    if file_id is None:
+        return None
+    return (file_id, getattr(file, "name", None), getattr(file, "size", None))
+
+
+def content_hash(file: Any) -> str:
+    """md5 of an uploaded file's contents, computed once per upload.
+
+    Streamlit hands out a new UploadedFile object on every rerun, so the hash is
+    remembered by the upload's id as well as on the object itself.
+    """
+    cached_hash = getattr(file, _HASH_ATTR, None)
+    if cached_hash is not None:
+        return cached_hash
+    file_id = _upload_id(file)
+    if file_id is not None and file_id in _upload_hashes:
+        cached_hash = _upload_hashes[file_id]
+    else:
+        cached_hash = _stream_md5(file)
+        if file_id is not None:
+            _upload_hashes[file_id] = cached_hash
+            while len(_upload_hashes) > _MAX_UPLOAD_HASHES:
+                _upload_hashes.popitem(last=False)
+    try:
+        setattr(file, _HASH_ATTR, cached_hash)
+    except AttributeError:
+        pass
+    return cached_hash
+
+
+def _key_part(arg: Any) -> Hashable:
+    if hasattr(arg, "getbuffer"):
+        return ("upload", getattr(arg, "name", None), content_hash(arg))
+    if hasattr(arg, "docs") and hasattr(arg, "id"):
+        return ("file", arg.id)
+    if isinstance(arg, str) and len(arg) > 256:
+        return ("str", md5(arg.encode("utf-8")).hexdigest())
+    if isinstance(arg, (list, tuple)):
+        return tuple(_key_part(a) for a in arg)
+    if isinstance(arg, dict):
+        return tuple(sorted((k, _key_part(v)) for k, v in arg.items()))
+    return arg
+
+
+def make_key(args: tuple, kwargs: dict) -> Hashable:
+    """Builds a cheap cache key: uploads by content hash and Files by id"""
+    return (
+        tuple(_key_part(a) for a in args),
+        tuple(sorted((k, _key_part(v)) for k, v in kwargs.items())),
+    )
+
+
+def cached(
+    policy: Optional[CachePolicy] = None, name: Optional[str] = None
+) -> Callable[[Callable], Callable]:
+    """Decorator caching a function's results in a registered BoundedCache.
+
+    Unlike `st.cache_data`, results are returned as is rather than copied, so
+    callers must not mutate them.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        cache = BoundedCache(name or func.__qualname__, policy)
+        CACHES[cache.name] = cache
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = make_key(args, kwargs)
+            found, value = cache.get(key)
+            if found:
+                return value
+            value = func(*args, **kwargs)
+            cache.set(key, value)
+            return value
+
+        wrapper.cache = cache  # type: ignore[attr-defined]
+        return wrapper
+
+    return decorator
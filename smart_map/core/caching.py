@@ -1,33 +1,30 @@
-import streamlit as st
-from streamlit.runtime.caching.hashing import HashFuncsDict
+from typing import Dict, Optional
 
-import smart_map.core.parsing as parsing
-import smart_map.core.chunking as chunking
-import smart_map.core.embedding as embedding
-from smart_map.core.parsing import File
+from smart_map.core.bounded_cache import CACHES, CachePolicy
 
+MB = 1024**2
 
-def file_hash_func(file: File) -> str:
-    """Get a unique hash for a file"""
-    return file.id
+# Limits for each cached pipeline stage, see CachePolicy
+CACHE_POLICIES: Dict[str, CachePolicy] = {
+    "read_file": CachePolicy(max_entries=32, max_bytes=256 * MB, ttl=60 * 60),
+    "chunk_file": CachePolicy(max_entries=32, max_bytes=256 * MB, ttl=60 * 60),
+    "embed_files": CachePolicy(max_entries=8, max_bytes=512 * MB, ttl=60 * 60),
+    "load_template": CachePolicy(max_entries=32, max_bytes=512 * MB, ttl=60 * 60),
+    "load_template_compact": CachePolicy(
+        max_entries=32, max_bytes=512 * MB, ttl=60 * 60
+    ),
+    "is_open_ai_key_valid": CachePolicy(max_entries=16, max_bytes=None, ttl=60 * 60),
+    "query_folder": CachePolicy(max_entries=256, max_bytes=64 * MB, ttl=60 * 60),
+}
 
 
-@st.cache_data(show_spinner=False)
-def bootstrap_caching():
-    """Patch module functions with caching"""
+def bootstrap_caching(policies: Optional[Dict[str, CachePolicy]] = None):
+    """Apply cache policy overrides.
 
-    # Get all substypes of File from module
-    file_subtypes = [
-        cls
-        for cls in vars(parsing).values()
-        if isinstance(cls, type) and issubclass(cls, File) and cls != File
-    ]
-    file_hash_funcs: HashFuncsDict = {cls: file_hash_func for cls in file_subtypes}
-
-    parsing.read_file = st.cache_data(show_spinner=False)(parsing.read_file)
-    chunking.chunk_file = st.cache_data(show_spinner=False, hash_funcs=file_hash_funcs)(
-        chunking.chunk_file
-    )
-    embedding.embed_files = st.cache_data(
-        show_spinner=False, hash_funcs=file_hash_funcs
-    )(embedding.embed_files)
+    The pipeline functions are wrapped with bounded caches where they are
+    defined, so this never re-wraps them and is cheap to call on every rerun.
+    """
+    for name, policy in (policies or {}).items():
+        CACHE_POLICIES[name] = policy
+        if name in CACHES:
+            CACHES[name].policy = policy
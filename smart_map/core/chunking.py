@@ -1,38 +1,163 @@
+import multiprocessing
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
 from langchain.docstore.document import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from smart_map.core.bounded_cache import cached
+from smart_map.core.caching import CACHE_POLICIES
 from smart_map.core.parsing import File
 
+# Separators tried in order by the splitter, as in RecursiveCharacterTextSplitter
+SEPARATORS = ["\n\n", "\n", " ", ""]
+# Inputs with at least this many pages are chunked across worker processes
+PARALLEL_MIN_PAGES = 200
+# Pages tokenized together, and sent to a worker as one task
+PAGES_PER_BATCH = 32
+# Worker processes for chunking, None for one per CPU
+CHUNK_WORKERS: Optional[int] = None
 
-def chunk_file(
-    file: File, chunk_size: int, chunk_overlap: int = 0, model_name="gpt-3.5-turbo"
-) -> File:
-    """Chunks each document in a file into smaller documents
-    according to the specified chunk size and overlap
-    where the size is determined by the number of token for the specified model.
+
+class Chunker:
+    """Splits page texts into chunks of at most `chunk_size` tokens.
+
+    Build it through `get_chunker`, which keeps one per configuration so the
+    tokenizer and splitter are only created once. Token counts for the pieces of
+    a batch of pages are computed by a single `encode_batch` call, which turns
+    most of the splitter's repeated length checks into dictionary lookups.
     """
 
-    # split each document into chunks
-    chunked_docs = []
-    for doc in file.docs:
-        text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-            model_name=model_name,
+    def __init__(
+        self, chunk_size: int, chunk_overlap: int = 0, model_name="gpt-3.5-turbo"
+    ):
+        import tiktoken
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+        self.encoding = tiktoken.encoding_for_model(model_name)
+        self.splitter = RecursiveCharacterTextSplitter(
+            separators=SEPARATORS,
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
+            length_function=self.count_tokens,
         )
+        # Token counts of the batch being split, per thread
+        self._local = threading.local()
+
+    def count_tokens(self, text: str) -> int:
+        counts: Optional[Dict[str, int]] = getattr(self._local, "counts", None)
+        if counts is not None and text in counts:
+            return counts[text]
+        count = len(
+            self.encoding.encode(text, allowed_special=set(), disallowed_special="all")
+        )
+        if counts is not None:
+            counts[text] = count
+        return count
+
+    def _first_splits(self, text: str) -> List[str]:
+        """The pieces RecursiveCharacterTextSplitter measures first"""
+        from langchain.text_splitter import _split_text_with_regex
+
+        separator = next(s for s in SEPARATORS if s == "" or re.search(s, text))
+        return _split_text_with_regex(text, separator, keep_separator=True)
+
+    def split_pages(self, texts: Sequence[str]) -> List[List[str]]:
+        """The chunks of each page text"""
+        pieces = list({piece for text in texts for piece in self._first_splits(text)})
+        tokens = self.encoding.encode_batch(
+            pieces, allowed_special=set(), disallowed_special="all"
+        )
+        self._local.counts = {piece: len(t) for piece, t in zip(pieces, tokens)}
+        try:
+            return [self.splitter.split_text(text) for text in texts]
+        finally:
+            self._local.counts = None
+
+
+@lru_cache(maxsize=16)
+def get_chunker(
+    chunk_size: int, chunk_overlap: int = 0, model_name="gpt-3.5-turbo"
+) -> Chunker:
+    return Chunker(chunk_size, chunk_overlap, model_name)
+
 
-        chunks = text_splitter.split_text(doc.page_content)
+def _split_batch(config: Tuple[int, int, str], texts: List[str]) -> List[List[str]]:
+    """Runs in a worker process, which keeps its own Chunker per configuration"""
+    return get_chunker(*config).split_pages(texts)
 
-        for i, chunk in enumerate(chunks):
-            doc = Document(
+
+@lru_cache(maxsize=None)
+def _chunk_pool() -> ProcessPoolExecutor:
+    """Worker processes for chunking, started once per process"""
+    return ProcessPoolExecutor(
+        max_workers=CHUNK_WORKERS,
+        mp_context=multiprocessing.get_context("forkserver"),
+    )
+
+
+def _batches(docs: Iterable[Document]) -> Iterator[List[Document]]:
+    docs = iter(docs)
+    while batch := list(islice(docs, PAGES_PER_BATCH)):
+        yield batch
+
+
+def iter_chunks(
+    docs: Iterable[Document],
+    chunk_size: int,
+    chunk_overlap: int = 0,
+    model_name="gpt-3.5-turbo",
+    parallel: Optional[bool] = None,
+) -> Iterator[Document]:
+    """Yields the chunks of a stream of page Documents as they are split.
+
+    Pages are split in batches, in worker processes if `parallel` is set, which
+    by default it is for sequences of at least PARALLEL_MIN_PAGES pages. Chunks
+    are yielded in page order either way, with at most a few batches in flight.
+    """
+    workers = CHUNK_WORKERS or os.cpu_count() or 1
+    if parallel is None:
+        parallel = isinstance(docs, Sequence) and len(docs) >= PARALLEL_MIN_PAGES
+    config = (chunk_size, chunk_overlap, model_name)
+
+    def split(batch: List[Document]) -> Future:
+        texts = [doc.page_content for doc in batch]
+        if parallel and workers > 1:
+            return _chunk_pool().submit(_split_batch, config, texts)
+        future: Future = Future()
+        future.set_result(get_chunker(*config).split_pages(texts))
+        return future
+
+    pending: "deque[Tuple[List[Document], Future]]" = deque()
+    for batch in _batches(docs):
+        pending.append((batch, split(batch)))
+        if len(pending) > 2 * workers or not parallel:
+            yield from _chunk_documents(*pending.popleft())
+    while pending:
+        yield from _chunk_documents(*pending.popleft())
+
+
+def _chunk_documents(batch: List[Document], chunks: Future) -> Iterator[Document]:
+    for doc, page_chunks in zip(batch, chunks.result()):
+        page = doc.metadata.get("page", 1)
+        for i, chunk in enumerate(page_chunks):
+            yield Document(
                 page_content=chunk,
-                metadata={
-                    "page": doc.metadata.get("page", 1),
-                    "chunk": i + 1,
-                    "source": f"{doc.metadata.get('page', 1)}-{i + 1}",
-                },
+                metadata={"page": page, "chunk": i + 1, "source": f"{page}-{i + 1}"},
             )
-            chunked_docs.append(doc)
 
-    chunked_file = file.copy()
-    chunked_file.docs = chunked_docs
-    return chunked_file
+
+@cached(CACHE_POLICIES["chunk_file"], "chunk_file")
+def chunk_file(
+    file: File, chunk_size: int, chunk_overlap: int = 0, model_name="gpt-3.5-turbo"
+) -> File:
+    """Chunks each document in a file into smaller documents
+    according to the specified chunk size and overlap
+    where the size is determined by the number of token for the specified model.
+    """
+    chunked_docs = list(iter_chunks(file.docs, chunk_size, chunk_overlap, model_name))
+    return file.with_docs(chunked_docs)
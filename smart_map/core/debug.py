@@ -1,3 +1,10 @@
+import functools
+import math
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
 from langchain.vectorstores import VectorStore
 from typing import Iterable, List, Any
 from langchain.docstore.document import Document
@@ -6,12 +13,188 @@ from langchain.embeddings.fake import FakeEmbeddings as FakeEmbeddingsBase
 from langchain.chat_models.fake import FakeListChatModel
 from typing import Optional
 
+# Sample tables and approved conversion code for exercising the full pipeline
+SAMPLE_TEMPLATE = "PolicyNumber,DOB,Salary\nAB1234,01/02/1990,50000\n"
+SAMPLE_CONVERSION_CODE = '''def convert(upload_df):
+    import pandas as pd
+    converted = pd.DataFrame()
+    converted["PolicyNumber"] = upload_df["policy_no"].str.replace("-", "")
+    converted["DOB"] = pd.to_datetime(upload_df["birth_date"]).dt.strftime("%m/%d/%Y")
+    converted["Salary"] = upload_df["salary"]
+    return converted
+'''
+
+
+def sample_table(rows: int, start: int = 0) -> str:
+    """A csv table that SAMPLE_CONVERSION_CODE maps to SAMPLE_TEMPLATE"""
+    lines = ["policy_no,birth_date,salary"]
+    lines += [
+        f"AB-{i:06d},1990-01-{i % 28 + 1:02d},{40000 + i}"
+        for i in range(start, start + rows)
+    ]
+    return "\n".join(lines) + "\n"
+
 
 class FakeChatModel(FakeListChatModel):
     def __init__(self, **kwargs):
         responses = ["The answer is 42. SOURCES: 1, 2, 3, 4"]
         super().__init__(responses=responses, **kwargs)
 
+    def _call(self, messages: List[Any], stop: Optional[List[str]] = None, **kwargs):
+        # Cycle through the responses so that chains of several calls work
+        response = self.responses[self.i % len(self.responses)]
+        self.i += 1
+        return response
+
+
+class SimulatedAPIError(Exception):
+    """Error injected by the simulated backend in place of an API failure"""
+
+
+class TokenBucket:
+    """Shared token rate limit; callers block until enough tokens are available"""
+
+    def __init__(self, tokens_per_minute: float):
+        self.rate = tokens_per_minute / 60.0
+        self.capacity = tokens_per_minute
+        self.tokens = tokens_per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float) -> float:
+        """Takes `tokens` from the bucket and returns the seconds spent waiting"""
+        tokens = min(tokens, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+@dataclass
+class FakeBackendConfig:
+    """Behaviour of the simulated LLM backend.
+
+    Each call takes a latency drawn from `latency` ("constant", "uniform",
+    "exponential" or "lognormal") with mean `latency_mean` seconds and spread
+    `latency_spread`, plus `seconds_per_output_token` per generated token. All
+    models sharing a config draw from one token bucket of `tokens_per_minute`,
+    like an API rate limit, and fail with probability `error_rate`.
+    """
+
+    latency: str = "lognormal"
+    latency_mean: float = 1.0
+    latency_spread: float = 0.5
+    seconds_per_output_token: float = 0.0
+    tokens_per_minute: Optional[float] = None
+    error_rate: float = 0.0
+    responses: List[str] = field(
+        default_factory=lambda: [
+            "| column | type | description |",
+            "| template column | table column | reasoning |",
+            "Values match the template format.",
+            "Columns are mapped one to one.",
+            "def convert(upload_df):\n    return upload_df",
+        ]
+    )
+    seed: Optional[int] = None
+
+    def __post_init__(self):
+        self._random = random.Random(self.seed)
+        self._lock = threading.Lock()
+        self.bucket = (
+            TokenBucket(self.tokens_per_minute) if self.tokens_per_minute else None
+        )
+
+    @classmethod
+    def from_env(cls) -> "FakeBackendConfig":
+        """Reads SMART_MAP_FAKE_<FIELD> environment variables"""
+        kwargs: dict = {}
+        for name, cast in (
+            ("latency", str),
+            ("latency_mean", float),
+            ("latency_spread", float),
+            ("seconds_per_output_token", float),
+            ("tokens_per_minute", float),
+            ("error_rate", float),
+            ("seed", int),
+        ):
+            value = os.environ.get(f"SMART_MAP_FAKE_{name.upper()}")
+            if value:
+                kwargs[name] = cast(value)
+        return cls(**kwargs)
+
+    def sample_latency(self) -> float:
+        mean, spread = self.latency_mean, self.latency_spread
+        with self._lock:
+            if self.latency == "constant":
+                return mean
+            if self.latency == "uniform":
+                return max(0.0, self._random.uniform(mean - spread, mean + spread))
+            if self.latency == "exponential":
+                return self._random.expovariate(1 / mean) if mean > 0 else 0.0
+            if self.latency == "lognormal":
+                if mean <= 0:
+                    return 0.0
+                # Parametrized so that the distribution's mean is `mean`
+                mu = math.log(mean) - spread**2 / 2
+                return self._random.lognormvariate(mu, spread)
+        raise ValueError(f"Latency distribution {self.latency} not supported.")
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+
+def _count_tokens(text: str) -> int:
+    # Roughly four characters per token for English text
+    return max(1, len(text) // 4)
+
+
+class SimulatedChatModel(FakeListChatModel):
+    """Fake chat model that behaves like a remote API: slow, rate limited and
+    occasionally failing, as configured by a FakeBackendConfig"""
+
+    backend: Any = None
+
+    def __init__(self, backend: Optional[FakeBackendConfig] = None, **kwargs):
+        backend = backend or default_fake_backend()
+        super().__init__(responses=backend.responses, backend=backend, **kwargs)
+
+    @property
+    def _llm_type(self) -> str:
+        return "simulated-chat-model"
+
+    def _call(self, messages: List[Any], stop: Optional[List[str]] = None, **kwargs):
+        backend: FakeBackendConfig = self.backend
+        response = self.responses[self.i % len(self.responses)]
+        self.i += 1
+        prompt_tokens = sum(_count_tokens(str(m.content)) for m in messages)
+        output_tokens = _count_tokens(response)
+        if backend.bucket is not None:
+            backend.bucket.acquire(prompt_tokens + output_tokens)
+        time.sleep(
+            backend.sample_latency() + output_tokens * backend.seconds_per_output_token
+        )
+        if backend.should_fail():
+            raise SimulatedAPIError("Simulated API error")
+        return response
+
+
+@functools.lru_cache(maxsize=None)
+def default_fake_backend() -> FakeBackendConfig:
+    """The backend shared by all simulated models of this process"""
+    return FakeBackendConfig.from_env()
+
 
 class FakeEmbeddings(FakeEmbeddingsBase):
     def __init__(self, **kwargs):
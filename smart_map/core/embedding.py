@@ -1,23 +1,134 @@
+import json
+import os
+import threading
+from hashlib import md5
+from typing import Dict, Iterable, List, Optional, Type
+from uuid import uuid4
+
+import numpy as np
 from langchain.vectorstores import VectorStore
+import smart_map.core.parsing as parsing
 from smart_map.core.parsing import File
-from langchain.vectorstores.faiss import FAISS
+from langchain.vectorstores.faiss import FAISS, dependable_faiss_import
+from langchain.docstore.in_memory import InMemoryDocstore
 from langchain.embeddings import OpenAIEmbeddings
 from langchain.embeddings.base import Embeddings
-from typing import List, Type
 from langchain.docstore.document import Document
 from smart_map.core.debug import FakeVectorStore, FakeEmbeddings
+from smart_map.core.bounded_cache import cached, estimate_nbytes
+from smart_map.core.caching import CACHE_POLICIES
+
+# Texts sent to the embedding model per request
+EMBED_BATCH_SIZE = 256
+
+_METADATA_FILE = "folder.json"
+_VECTORS_FILE = "vectors.npy"
+_FAISS_FILE = "index.faiss"
+
+
+def text_hash(text: str) -> str:
+    return md5(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings that keeps the vector of every text it has embedded, by the
+    text's hash. Only texts it has not seen are sent to the model, each once and
+    in batches of `batch_size`."""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        vectors: Optional[Dict[str, np.ndarray]] = None,
+        batch_size: int = EMBED_BATCH_SIZE,
+    ):
+        self.embeddings = embeddings
+        self.vectors: Dict[str, np.ndarray] = vectors if vectors is not None else {}
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+
+    def embed_hashed(self, texts: List[str], hashes: List[str]) -> np.ndarray:
+        """Vectors of texts whose hashes are already known, as one array"""
+        with self._lock:
+            missing = {h: t for h, t in zip(hashes, texts) if h not in self.vectors}
+        pending = list(missing.items())
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start : start + self.batch_size]
+            vectors = self.embeddings.embed_documents([text for _, text in batch])
+            with self._lock:
+                for (h, _), vector in zip(batch, vectors):
+                    self.vectors[h] = np.asarray(vector, dtype=np.float32)
+        return self.stack(hashes)
+
+    def stack(self, hashes: List[str]) -> np.ndarray:
+        """Kept vectors of the given hashes, as one array"""
+        with self._lock:
+            return np.stack([self.vectors[h] for h in hashes])
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the kept vectors, except those memory-mapped from a saved index"""
+        with self._lock:
+            return sum(
+                v.nbytes for v in self.vectors.values() if not isinstance(v, np.memmap)
+            )
+
+    def retain(self, hashes: Iterable[str]) -> None:
+        """Forgets the vectors of every hash not in `hashes`"""
+        keep = set(hashes)
+        with self._lock:
+            self.vectors = {h: v for h, v in self.vectors.items() if h in keep}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self.embed_hashed(texts, [text_hash(t) for t in texts]).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
 
 
 class FolderIndex:
-    """Index for a collection of files (a folder)"""
+    """Index for a collection of files (a folder).
 
-    def __init__(self, files: List[File], index: VectorStore):
+    Files are added and removed incrementally by `File.id`, and the vector of
+    every chunk is kept by the chunk's content hash, so a chunk is only embedded
+    once however often the folder changes. `version` increases on every change,
+    and `sources` maps each source key to its documents.
+    """
+
+    def __init__(
+        self,
+        files: List[File],
+        index: Optional[VectorStore],
+        embeddings: Optional[CachedEmbeddings] = None,
+        vector_store: Optional[Type[VectorStore]] = None,
+    ):
         self.name: str = "default"
-        self.files = files
-        self.index: VectorStore = index
+        # Identifies this index, with `version`, in caches of its query results
+        self.uid = uuid4().hex
+        self._files: Dict[str, File] = {file.id: file for file in files}
+        self.index: Optional[VectorStore] = index
+        self.embeddings = embeddings
+        self.vector_store = vector_store or type(index)
+        self.version = 0
+        self.sources: Dict[str, List[Document]] = {}
+        self._add_sources(self._combine_files(files))
+        self._lock = threading.RLock()
+
+    @property
+    def files(self) -> List[File]:
+        return list(self._files.values())
+
+    @property
+    def nbytes(self) -> int:
+        """Rough resident size: kept vectors, the FAISS index and the files"""
+        nbytes = getattr(self.embeddings, "nbytes", 0)
+        if isinstance(self.index, FAISS):
+            nbytes += self.index.index.ntotal * self.index.index.d * 4
+        return nbytes + sum(estimate_nbytes(file) for file in self.files)
 
     @staticmethod
-    def _combine_files(files: List[File]) -> List[Document]:
+    def _combine_files(files: Iterable[File]) -> List[Document]:
         """Combines all the documents in a list of files into a single list."""
 
         all_texts = []
@@ -29,22 +140,189 @@ class FolderIndex:
 
         return all_texts
 
+    def _add_sources(self, docs: List[Document]) -> None:
+        for doc in docs:
+            self.sources.setdefault(doc.metadata.get("source"), []).append(doc)
+
+    def _build_index(self, docs: List[Document]) -> Optional[VectorStore]:
+        if not docs:
+            return None
+        return self.vector_store.from_texts(
+            [doc.page_content for doc in docs],
+            embedding=self.embeddings,
+            metadatas=[doc.metadata for doc in docs],
+        )
+
     @classmethod
     def from_files(
         cls, files: List[File], embeddings: Embeddings, vector_store: Type[VectorStore]
     ) -> "FolderIndex":
         """Creates an index from files."""
+        if not isinstance(embeddings, CachedEmbeddings):
+            embeddings = CachedEmbeddings(embeddings)
+        folder_index = cls(
+            files=[], index=None, embeddings=embeddings, vector_store=vector_store
+        )
+        folder_index.add_files(files)
+        return folder_index
 
-        all_docs = cls._combine_files(files)
+    def add_files(self, files: List[File]) -> List[str]:
+        """Embeds and indexes the files not in the index yet. Returns their ids."""
+        with self._lock:
+            new_files: Dict[str, File] = {}
+            for file in files:
+                if file.id not in self._files:
+                    new_files.setdefault(file.id, file)
+            docs = self._combine_files(new_files.values())
+            if self.index is None:
+                self.index = self._build_index(docs)
+            elif isinstance(self.index, FAISS):
+                # FAISS.add_texts embeds one text at a time
+                texts = [doc.page_content for doc in docs]
+                if texts:
+                    vectors = self.embeddings.embed_documents(texts)
+                    self.index.add_embeddings(
+                        zip(texts, vectors), [doc.metadata for doc in docs]
+                    )
+            elif docs:
+                self.index.add_texts(
+                    [doc.page_content for doc in docs], [doc.metadata for doc in docs]
+                )
+            self._files.update(new_files)
+            self._add_sources(docs)
+            if new_files:
+                self.version += 1
+            return list(new_files)
 
-        index = vector_store.from_documents(
-            documents=all_docs,
-            embedding=embeddings,
+    def remove_files(self, file_ids: Iterable[str]) -> List[str]:
+        """Removes files from the index. Returns the ids that were indexed.
+
+        The index is rebuilt from the remaining chunks' kept vectors, so nothing
+        is embedded again, and the vectors no remaining chunk uses are dropped.
+        """
+        with self._lock:
+            removed = [i for i in dict.fromkeys(file_ids) if i in self._files]
+            if not removed:
+                return []
+            for file_id in removed:
+                del self._files[file_id]
+            docs = self._combine_files(self._files.values())
+            self.index = self._build_index(docs)
+            if isinstance(self.embeddings, CachedEmbeddings):
+                self.embeddings.retain(text_hash(doc.page_content) for doc in docs)
+            self.sources = {}
+            self._add_sources(docs)
+            self.version += 1
+            return removed
+
+    def save(self, path: str) -> None:
+        """Writes the index to a directory: the FAISS index, the vectors of the
+        indexed chunks and a JSON file with the files and their documents."""
+        with self._lock:
+            os.makedirs(path, exist_ok=True)
+            docs = self._combine_files(self._files.values())
+            texts = {text_hash(doc.page_content): doc.page_content for doc in docs}
+            hashes = list(texts)
+            # Embeds again any vector dropped by another index sharing embeddings
+            vectors = (
+                self.embeddings.embed_hashed(list(texts.values()), hashes)
+                if hashes
+                else np.empty((0, 0), dtype=np.float32)
+            )
+            _replace(path, _VECTORS_FILE, lambda f: np.save(f, vectors))
+            if isinstance(self.index, FAISS):
+                faiss = dependable_faiss_import()
+                _replace(
+                    path,
+                    _FAISS_FILE,
+                    lambda f: f.write(faiss.serialize_index(self.index.index)),
+                )
+            metadata = {
+                "name": self.name,
+                "version": self.version,
+                "hashes": hashes,
+                "files": [
+                    {
+                        "type": type(file).__name__,
+                        "name": file.name,
+                        "id": file.id,
+                        "metadata": file.metadata,
+                        "docs": [
+                            {"page_content": doc.page_content, "metadata": doc.metadata}
+                            for doc in file.docs
+                        ],
+                    }
+                    for file in self._files.values()
+                ],
+                "docstore_ids": [
+                    self.index.index_to_docstore_id[i]
+                    for i in range(len(self.index.index_to_docstore_id))
+                ]
+                if isinstance(self.index, FAISS)
+                else None,
+            }
+            # Written last, so a partially saved index is never loaded
+            _replace(
+                path,
+                _METADATA_FILE,
+                lambda f: f.write(json.dumps(metadata).encode("utf-8")),
+            )
+
+    @classmethod
+    def load(
+        cls, path: str, embeddings: Embeddings, vector_store: Type[VectorStore]
+    ) -> "FolderIndex":
+        """Loads an index written by `save`. The vectors and the FAISS index are
+        memory-mapped rather than read into memory. The FAISS index is read into
+        memory: it is a flat index, which faiss cannot memory-map."""
+        with open(os.path.join(path, _METADATA_FILE), encoding="utf-8") as f:
+            metadata = json.load(f)
+        vectors = np.load(os.path.join(path, _VECTORS_FILE), mmap_mode="r")
+        if not isinstance(embeddings, CachedEmbeddings):
+            embeddings = CachedEmbeddings(embeddings)
+        for h, vector in zip(metadata["hashes"], vectors):
+            embeddings.vectors.setdefault(h, vector)
+
+        files = [
+            getattr(parsing, entry["type"])(
+                name=entry["name"],
+                id=entry["id"],
+                metadata=entry["metadata"],
+                docs=[Document(**doc) for doc in entry["docs"]],
+            )
+            for entry in metadata["files"]
+        ]
+        folder_index = cls(
+            files=files, index=None, embeddings=embeddings, vector_store=vector_store
         )
+        folder_index.name = metadata["name"]
+        folder_index.version = metadata["version"]
+        docs = cls._combine_files(files)
+        ids = metadata["docstore_ids"]
+        faiss_path = os.path.join(path, _FAISS_FILE)
+        if vector_store is FAISS and ids and os.path.exists(faiss_path):
+            faiss = dependable_faiss_import()
+            folder_index.index = FAISS(
+                embeddings.embed_query,
+                faiss.read_index(faiss_path),
+                InMemoryDocstore(dict(zip(ids, docs))),
+                dict(enumerate(ids)),
+            )
+        else:
+            folder_index.index = folder_index._build_index(docs)
+        return folder_index
+
 
-        return cls(files=files, index=index)
+def _replace(path: str, name: str, write) -> None:
+    """Writes a file through a temporary file, so readers never see it half written"""
+    target = os.path.join(path, name)
+    tmp = f"{target}.tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, target)
 
 
+@cached(CACHE_POLICIES["embed_files"], "embed_files")
 def embed_files(
     files: List[File], embedding: str, vector_store: str, **kwargs
 ) -> FolderIndex:
@@ -0,0 +1,82 @@
+import pandas as pd
+
+
+def frame_nbytes(df: pd.DataFrame) -> int:
+    """Resident size of a DataFrame in bytes, including string contents"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def _compact_column(values: pd.Series, max_category_ratio: float) -> pd.Series:
+    if pd.api.types.is_bool_dtype(values):
+        return values
+    if pd.api.types.is_integer_dtype(values):
+        downcast = "unsigned" if len(values) and values.min() >= 0 else "integer"
+        return pd.to_numeric(values, downcast=downcast)
+    if pd.api.types.is_float_dtype(values):
+        # Only where no value changes, e.g. not for amounts like 12345.67
+        narrow = values.astype("float32")
+        return narrow if narrow.astype(values.dtype).equals(values) else values
+    if pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+        non_null = values.dropna()
+        if not non_null.map(type).eq(str).all():
+            return values
+        n_unique = non_null.nunique()
+        if len(values) and n_unique <= max_category_ratio * len(values):
+            categories = pd.Index(non_null.unique(), dtype="string[pyarrow]")
+            return values.astype(pd.CategoricalDtype(categories))
+        return values.astype("string[pyarrow]")
+    return values
+
+
+def compact_frame(df: pd.DataFrame, max_category_ratio: float = 0.5) -> pd.DataFrame:
+    """Returns a memory-compact version of a DataFrame.
+
+    Integers are downcast to the smallest dtype holding their values and floats
+    to float32 where that is lossless. String columns with few distinct values
+    become categoricals and the rest use the Arrow string dtype.
+
+    This is a storage format: categoricals reject values outside their
+    categories and small integers overflow in arithmetic, so generated code must
+    run on `expand_frame` of it, as `convert_table` does.
+
+    Args:
+        df (pd.DataFrame): The frame to compact.
+        max_category_ratio (float): Maximum ratio of distinct values to rows for a
+        string column to be stored as a categorical.
+
+    Returns:
+        pd.DataFrame: The compact frame.
+    """
+    return pd.DataFrame(
+        {name: _compact_column(df[name], max_category_ratio) for name in df.columns},
+        index=df.index,
+    )
+
+
+def expand_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Undoes the dtype changes of `compact_frame` that generated conversion code
+    trips over: categoricals become their categories' dtype (Arrow strings) and
+    integers narrower than 64 bits become int64. Other columns are not copied
+    under copy-on-write."""
+    dtypes = {}
+    for name, dtype in df.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            dtypes[name] = dtype.categories.dtype
+        elif (
+            pd.api.types.is_integer_dtype(dtype)
+            and not pd.api.types.is_extension_array_dtype(dtype)
+            and dtype.itemsize < 8
+        ):
+            dtypes[name] = "int64"
+    return df.astype(dtypes) if dtypes else df
+
+
+def format_nbytes(n: float) -> str:
+    """Formats a byte count for display, e.g. 1536 -> "1.5 KB" """
+    if abs(n) < 1024:
+        return f"{n:.0f} B"
+    for unit in ("KB", "MB"):
+        n /= 1024
+        if abs(n) < 1024:
+            return f"{n:.1f} {unit}"
+    return f"{n / 1024:.1f} GB"
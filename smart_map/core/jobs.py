@@ -0,0 +1,448 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, fields
+from io import StringIO
+from typing import Any, Dict, List, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+AWAITING_APPROVAL = "awaiting_approval"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Stages a job goes through: the LLM mapping chains, then the conversion
+MAP = "map"
+CONVERT = "convert"
+
+# Outputs of the mapping chains kept with a job
+CHAIN_OUTPUTS = ("initial", "find_similar", "mapping", "mapping_code", "code")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    created REAL NOT NULL,
+    queued REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    request TEXT NOT NULL,
+    chain_output TEXT,
+    code TEXT,
+    result_rows INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, queued);
+"""
+
+
+@dataclass
+class ResourceLimits:
+    """Limits applied to the process running a single job"""
+
+    timeout: float = 300.0
+    memory_mb: Optional[int] = 2048
+    cpu_seconds: Optional[int] = None
+
+    @staticmethod
+    def parse(requested: Any) -> Optional[Dict[str, Any]]:
+        """Validates per-job limits from a client, converting numeric strings.
+        Raises ValueError for anything that is not a positive number."""
+        if requested is None:
+            return None
+        if not isinstance(requested, dict):
+            raise ValueError("limits must be an object")
+        types = {"timeout": float, "memory_mb": int, "cpu_seconds": int}
+        unknown = set(requested) - set(types)
+        if unknown:
+            raise ValueError(f"Unknown limits: {sorted(unknown)}")
+        limits = {}
+        for name, value in requested.items():
+            if value is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+                raise ValueError(f"limits.{name} must be a number")
+            try:
+                value = types[name](float(value))
+            except ValueError:
+                raise ValueError(f"limits.{name} must be a number") from None
+            if not value > 0:
+                raise ValueError(f"limits.{name} must be positive")
+            limits[name] = value
+        return limits
+
+    def clamp(self, requested: Optional[Dict[str, Any]]) -> "ResourceLimits":
+        """Applies per-job limits, which may only be tighter than these"""
+        limits = ResourceLimits(**asdict(self))
+        for name, value in (requested or {}).items():
+            if not hasattr(limits, name) or value is None:
+                continue
+            current = getattr(limits, name)
+            setattr(limits, name, value if current is None else min(current, value))
+        return limits
+
+
+@dataclass
+class JobRequest:
+    """What a client submits to map a table to a template.
+
+    If `code` is given it is used as the approved conversion code; otherwise the
+    code generated by the mapping chains is used when `auto_approve` is set, or
+    the job waits for approval.
+    """
+
+    template: str
+    table: str
+    model: str = "openai"
+    model_name: str = "gpt-3.5-turbo"
+    code: Optional[str] = None
+    auto_approve: bool = False
+    run_mapping: Optional[bool] = None
+    limits: Optional[Dict[str, Any]] = None
+
+    def __post_init__(self):
+        if self.run_mapping is None:
+            self.run_mapping = self.code is None
+
+    @classmethod
+    def from_dict(cls, body: Dict[str, Any]) -> "JobRequest":
+        """Builds a request from a client's JSON body. Raises ValueError if a
+        field is unknown, missing or of the wrong type, or if the job could not
+        run."""
+        from smart_map.core.mapping import MODELS
+
+        unknown = set(body) - {f.name for f in fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown fields: {sorted(unknown)}")
+        for name in ("template", "table"):
+            if not isinstance(body.get(name), str):
+                raise ValueError(f"{name} must be a csv string")
+        for name in ("model", "model_name", "code"):
+            if name in body and not isinstance(body[name], (str, type(None))):
+                raise ValueError(f"{name} must be a string")
+        for name in ("auto_approve", "run_mapping"):
+            if name in body and not isinstance(body[name], (bool, type(None))):
+                raise ValueError(f"{name} must be true or false")
+        request = dict(body)
+        for name in ("model", "model_name", "auto_approve"):
+            if request.get(name, 0) is None:
+                del request[name]
+        request["limits"] = ResourceLimits.parse(body.get("limits"))
+        request = cls(**request)
+        if request.model not in MODELS:
+            raise ValueError(f"model must be one of {list(MODELS)}")
+        if not request.run_mapping and request.code is None:
+            raise ValueError("code is required when run_mapping is false")
+        return request
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/p99, mean and max of a list of measurements"""
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    return {
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "mean": sum(ordered) / len(ordered),
+        "max": ordered[-1],
+    }
+
+
+class JobQueue:
+    """Jobs persisted in a local SQLite database so they survive restarts"""
+
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self.results_dir = os.path.join(data_dir, "results")
+        os.makedirs(self.results_dir, exist_ok=True)
+        self._db = sqlite3.connect(
+            os.path.join(data_dir, "jobs.sqlite3"), check_same_thread=False
+        )
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self.available = threading.Condition(self._lock)
+        self.started = time.time()
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+            # Jobs interrupted by a restart are run again
+            self._db.execute(
+                "UPDATE jobs SET status = ?, started = NULL WHERE status = ?",
+                (QUEUED, RUNNING),
+            )
+
+    def submit(self, request: JobRequest) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, stage, created, queued, request, code)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id,
+                    QUEUED,
+                    MAP if request.run_mapping else CONVERT,
+                    now,
+                    now,
+                    json.dumps(asdict(request)),
+                    request.code,
+                ),
+            )
+            self.available.notify()
+        return job_id
+
+    def approve(self, job_id: str, code: Optional[str] = None) -> bool:
+        """Queues the conversion of a job awaiting approval, optionally with
+        edited code. Returns False if the job is not awaiting approval."""
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = ?, stage = ?, queued = ?,"
+                " code = COALESCE(?, code) WHERE id = ? AND status = ?",
+                (QUEUED, CONVERT, time.time(), code, job_id, AWAITING_APPROVAL),
+            )
+            if cursor.rowcount:
+                self.available.notify()
+            return cursor.rowcount > 0
+
+    def claim(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Marks the oldest queued job as running and returns it, waiting up to
+        `timeout` seconds for one to be submitted"""
+        with self._lock:
+            row = self._next_queued()
+            if row is None:
+                self.available.wait(timeout)
+                row = self._next_queued()
+            if row is None:
+                return None
+            with self._db:
+                self._db.execute(
+                    "UPDATE jobs SET status = ?, started = ? WHERE id = ?",
+                    (RUNNING, time.time(), row["id"]),
+                )
+            return dict(row)
+
+    def _next_queued(self) -> Optional[sqlite3.Row]:
+        return self._db.execute(
+            "SELECT * FROM jobs WHERE status = ? ORDER BY queued LIMIT 1", (QUEUED,)
+        ).fetchone()
+
+    def finish(self, job_id: str, outcome: Dict[str, Any]) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, finished = ?,"
+                " chain_output = COALESCE(?, chain_output),"
+                " code = COALESCE(?, code), result_rows = ?, error = ? WHERE id = ?",
+                (
+                    outcome["status"],
+                    time.time(),
+                    json.dumps(outcome["chain_output"])
+                    if outcome.get("chain_output")
+                    else None,
+                    outcome.get("code"),
+                    outcome.get("result_rows"),
+                    outcome.get("error"),
+                    job_id,
+                ),
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, status, stage, created, queued, started, finished,"
+                " chain_output, code, result_rows, error FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["chain_output"] = json.loads(job["chain_output"] or "null")
+        return job
+
+    def result_path(self, job_id: str) -> str:
+        return os.path.join(self.results_dir, f"{job_id}.csv")
+
+    def metrics(self, window: float = 300.0) -> Dict[str, Any]:
+        """Job counts, throughput and latencies over the last `window` seconds.
+
+        Throughput is measured over the part of the window the queue has been
+        open for, or since the earliest counted job was queued if that is
+        earlier, so it is not understated just after startup.
+        """
+        now = time.time()
+        since = now - window
+        with self._lock:
+            counts = dict(
+                self._db.execute(
+                    "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+                ).fetchall()
+            )
+            rows = self._db.execute(
+                "SELECT queued, started, finished FROM jobs"
+                " WHERE status = ? AND finished >= ?",
+                (SUCCEEDED, since),
+            ).fetchall()
+        measured = now - max(since, min([self.started] + [r[0] for r in rows]))
+        return {
+            "jobs": counts,
+            "window_seconds": window,
+            "measured_seconds": measured,
+            "completed_in_window": len(rows),
+            "throughput_per_second": len(rows) / measured if measured > 0 else 0.0,
+            "queue_wait_seconds": percentiles([r[1] - r[0] for r in rows]),
+            "run_seconds": percentiles([r[2] - r[1] for r in rows]),
+            "total_seconds": percentiles([r[2] - r[0] for r in rows]),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def _apply_limits(limits: ResourceLimits) -> None:
+    try:
+        import resource
+    except ImportError:  # Not available on Windows
+        return
+    if limits.memory_mb is not None:
+        nbytes = limits.memory_mb * 1024**2
+        resource.setrlimit(resource.RLIMIT_AS, (nbytes, nbytes))
+    if limits.cpu_seconds is not None:
+        seconds = int(limits.cpu_seconds)
+        resource.setrlimit(resource.RLIMIT_CPU, (seconds, seconds))
+
+
+def execute_job(job: Dict[str, Any], limits: ResourceLimits, conn) -> None:
+    """Runs one stage of a job in a child process and sends back the outcome"""
+    import pandas as pd
+
+    from smart_map.core.mapping import (
+        build_tables_prompt,
+        convert_table,
+        create_chains,
+        create_function_from_string,
+        get_llm,
+    )
+
+    outcome: Dict[str, Any] = {}
+    try:
+        _apply_limits(limits)
+        request = JobRequest(**json.loads(job["request"]))
+        code = job["code"]
+        if job["stage"] == MAP:
+            llm = get_llm(
+                request.model,
+                model_name=request.model_name,
+                openai_api_key=os.environ.get("OPENAI_API_KEY"),
+            )
+            chain_output = create_chains(llm, verbose=False)(
+                build_tables_prompt(request.template, request.table)
+            )
+            outcome["chain_output"] = {k: chain_output[k] for k in CHAIN_OUTPUTS}
+            if code is None and request.auto_approve:
+                code = chain_output["code"]
+            if code is None:
+                outcome.update(status=AWAITING_APPROVAL, code=chain_output["code"])
+                conn.send(outcome)
+                return
+
+        table_df = pd.read_csv(StringIO(request.table))
+        converted = convert_table(create_function_from_string(code), table_df)
+        converted.to_csv(job["result_path"], index=False)
+        outcome.update(status=SUCCEEDED, code=code, result_rows=len(converted))
+    except MemoryError:
+        outcome.update(status=FAILED, error="Job exceeded its memory limit")
+    except Exception as e:
+        outcome.update(status=FAILED, error=f"{e.__class__.__name__}: {e}")
+    conn.send(outcome)
+
+
+class WorkerPool:
+    """Threads that claim jobs from a JobQueue and run each in its own process,
+    so a job can be killed when it exceeds its limits"""
+
+    def __init__(self, queue: JobQueue, workers: int = 2, limits=None):
+        self.queue = queue
+        self.workers = workers
+        self.limits = limits or ResourceLimits()
+        self._context = multiprocessing.get_context("forkserver")
+        # Children fork from a server with the pipeline already imported;
+        # mapping.py imports langchain lazily, so it is preloaded explicitly
+        self._context.set_forkserver_preload(
+            ["smart_map.core.mapping", "langchain.chains", "langchain.llms"]
+        )
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"smart-map-worker-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self.queue.available:
+            self.queue.available.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self) -> None:
+        while not self._stop.is_set():
+            job = self.queue.claim(timeout=1.0)
+            if job is None:
+                continue
+            try:
+                outcome = self._run(job)
+            except Exception as e:
+                # The job fails rather than the worker, which would leave it
+                # running and stop claiming jobs
+                outcome = {"status": FAILED, "error": f"{e.__class__.__name__}: {e}"}
+            self.queue.finish(job["id"], outcome)
+
+    def _run(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        request = json.loads(job["request"])
+        limits = self.limits.clamp(request.get("limits"))
+        job["result_path"] = self.queue.result_path(job["id"])
+        receiver, sender = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=execute_job, args=(job, limits, sender), daemon=True
+        )
+        process.start()
+        sender.close()
+        outcome: Optional[Dict[str, Any]] = None
+        try:
+            if receiver.poll(limits.timeout):
+                outcome = receiver.recv()
+            else:
+                outcome = {
+                    "status": FAILED,
+                    "error": f"Job exceeded its time limit of {limits.timeout}s",
+                }
+        except EOFError:
+            pass
+        finally:
+            receiver.close()
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        if outcome is None:
+            # Killed before reporting back, e.g. by its CPU limit
+            outcome = {
+                "status": FAILED,
+                "error": f"Job process exited with code {process.exitcode}",
+            }
+        return outcome
@@ -0,0 +1,240 @@
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from smart_map.core.frames import expand_frame
+
+# Tables loaded through the shared caches are handed to every session as the
+# same object, so in-place edits by generated code must land on a private copy.
+# The option is process-wide: turning it on per call with option_context would
+# let one session's conversion turn it off while another is still running.
+pd.set_option("mode.copy_on_write", True)
+
+# langchain takes seconds to import, so it is only imported once a mapping runs
+if TYPE_CHECKING:
+    from langchain.base_language import BaseLanguageModel
+    from langchain.chains import SequentialChain
+    from langchain.prompts import PromptTemplate
+
+
+# Models get_llm can create
+MODELS = ("openai", "debug", "simulated")
+
+
+def get_llm(
+    model: str = "openai",
+    model_name: str = "gpt-3.5-turbo",
+    openai_api_key: Optional[str] = None,
+    temperature: float = 0.1,
+) -> "BaseLanguageModel":
+    """Creates the language model used by the mapping chains"""
+    if model == "openai":
+        from langchain.llms import OpenAI
+
+        return OpenAI(
+            temperature=temperature,
+            openai_api_key=openai_api_key,
+            model_name=model_name,
+        )
+    elif model == "debug":
+        from smart_map.core.debug import FakeChatModel
+
+        return FakeChatModel()
+    elif model == "simulated":
+        from smart_map.core.debug import SimulatedChatModel
+
+        return SimulatedChatModel()
+    else:
+        raise ValueError(f"Model {model} not supported.")
+
+
+def build_tables_prompt(
+    template_string: str, table_string: str, table_name: str = "A"
+) -> str:
+    """Combines the template and the table to map into the mapping chain input"""
+    return f"""
+                    Here is the template table: \n
+                    {template_string}
+                    
+                    Here is the table (table {table_name}) to be mapped into the template schema: \n
+                    {table_string}
+                    
+                    \n
+                    """
+
+
+@lru_cache(maxsize=None)
+def _prompt_templates() -> Tuple[Tuple["PromptTemplate", str], ...]:
+    """The prompt and output key of each mapping chain, built once per process"""
+    from langchain.prompts import PromptTemplate
+
+    prompts = []
+    # Chain  1
+    template = """Your task is to map a table that is formatted as a csv into the schema defined by a template\
+    by transferring values and transforming values into the target format of the Template table.
+    {tables}
+    Extract information about the columns of the Template table and table A in the format of a text description. All of the data\
+    is passed as text but if the text is numeric, describe the column data as numeric. 
+    Format your response in markdown language using two tables. 
+    The first table describes the template table where the first column contains the column name, the second contains the interpreted type of data, and the third gives a description of what that data appears to be.
+    The second table describes the Table A where the first column contains the column name, the second contains the interpreted type of data, and the third gives a description of what that data appears to be.
+"""
+    prompt_template = PromptTemplate(input_variables=["tables"], template=template)
+    prompts.append((prompt_template, "initial"))
+
+    # Chain 2
+    template = """
+    Here are the tables we are using to create a mapping function from the example (Table A) to the template schema (tempate):
+    {tables}
+    Here is a description of the tables:
+    {initial}
+    Your goal is to figure out the mapping between columns from the input table to the template table
+    based on the column names and data value types, describe this mapping like a dictionary mapping.
+    For each column in the template table, suggest columns from table A (1 or more relevant candidates), 
+    showing the basis for the decision (formats, distributions, and other features that are highlighted in the backend).
+    If more than 1 column can map from table A to the template, include both as other tables that use this mapping may have either of the possible columns.
+    Format your response in markdown language as a table where the first column represents the template column, the second column\
+        represents the column from Table A that is being mapped to the template column, and the third column explains the reasoning.
+        
+    """
+    prompt_template = PromptTemplate(input_variables=["tables","initial"], template=template)
+    prompts.append((prompt_template, "find_similar"))
+
+    template = """
+    Here are the tables we are using to create a mapping function from the example (Table A) to the template schema (tempate):
+    {tables}
+    Here is a description of the tables:
+    {initial}
+    and here are the projected column-column pairs:
+    {find_similar}
+    For each of the columns that is mapped from A to the template, does the value of A match that of the value for the corresponding row in template?
+    Does any transformation need to be applied to make the value match, such as changing the style of the datetime? Are there differences in characters, such as dashes, - , that need to be removed?
+
+    For text data columns like policy, do you need to remove a hyphen, -, to make the columns match?
+    Do you need to reformat data columns to match?
+    """
+    prompt_template = PromptTemplate(input_variables=["tables","initial","find_similar"], template=template)
+    prompts.append((prompt_template, "mapping"))
+
+    template = """
+    Here are the tables we are using to create a mapping function from the example (Table A) to the template schema (tempate):
+    {tables}
+    Here is a description of the tables:
+    {initial}
+    and here are the original column-column pairs to match from Table A to template schema:
+    {mapping}
+
+    Automatically generate data mapping code for each column display in the final Template format. 
+    For example, for date columns, they may be in different formats, and it is necessary to change the order. 
+    If more than one column maps from Table A to the template table column, create a dynamic mapping that can convert either without running into an error.
+    Define a function that maps an input table that has schema similar to Table A (upload_df) to schema of template, with the correct naming convention from the template.
+    Format your response in python language returning the complete, executable codeblock, and with each line of code described with a markdown comment.
+    Only provide the mapping for relevant to the columns in the template but make it dynamic to account for potential alternative columns.
+    There should be no code to map to a column that is not in the template table.
+    Be sure to perform the necessary data manipulation on column values to make the values of table A match the format of the template, such as reformatting date and removing hyphens.
+    """
+    prompt_template = PromptTemplate(input_variables=["tables","initial","mapping"], template=template)
+    prompts.append((prompt_template, "mapping_code"))
+    
+    template = """
+    {tables}
+    For the following code, return a function that takes a pandas dataframe and uses the specifed column mappings to return a properly formatted dataframe. Return only the executable python code.
+    Do not include any single quotes or reference, return just the code that can be copy-pasted into python.
+    Be sure to include transformation steps: 
+    1. reformatting date column in necessary
+    2. removing "-" from string data to make columns match template. Specifically, remove from the PolicyNumber column.
+    {mapping}
+    Here is the code:
+    {mapping_code}
+
+    Do not include any unnecessary lines like ('''python) and do not return any examples. Only return the function that takes a table and converts it to the desired schema.
+    Make sure that the code maps the appropriate columns and values from Table A to the template. If the code does not, either fix it or report an issue.
+    """
+    prompt_template = PromptTemplate(input_variables=["tables", "mapping", "mapping_code"], template=template)
+    prompts.append((prompt_template, "code"))
+    
+    return tuple(prompts)
+
+
+def create_chains(llm: "BaseLanguageModel", verbose: bool = True) -> "SequentialChain":
+    """Builds the sequence of chains that describes both tables, matches their
+    columns and generates the code converting Table A to the template schema."""
+    from langchain.chains import LLMChain, SequentialChain
+
+    chains: List[LLMChain] = [
+        LLMChain(llm=llm, prompt=prompt_template, output_key=output_key)
+        for prompt_template, output_key in _prompt_templates()
+    ]
+    overall_chain = SequentialChain(
+                        chains=chains,
+                        input_variables=["tables"],
+                        output_variables=["initial","find_similar","mapping","mapping_code","code"],
+                        verbose=verbose,
+                    )
+    return overall_chain
+
+
+@lru_cache(maxsize=8)
+def _shared_chain(
+    model_name: str, openai_api_key: Optional[str], verbose: bool
+) -> "SequentialChain":
+    return create_chains(
+        get_llm("openai", model_name=model_name, openai_api_key=openai_api_key),
+        verbose=verbose,
+    )
+
+
+def get_mapping_chain(
+    model: str = "openai",
+    model_name: str = "gpt-3.5-turbo",
+    openai_api_key: Optional[str] = None,
+    verbose: bool = True,
+) -> "SequentialChain":
+    """Returns the mapping chain for a model, built once per process and shared.
+
+    The chains hold no per-run state, so one instance serves every session.
+    Fake models count the responses they have returned, so each call gets a
+    fresh chain for those.
+    """
+    if model == "openai":
+        return _shared_chain(model_name, openai_api_key, verbose)
+    return create_chains(
+        get_llm(model, model_name=model_name, openai_api_key=openai_api_key),
+        verbose=verbose,
+    )
+
+
+def create_function_from_string(func_string: str) -> Callable[..., Any]:
+    """
+    Create a function from a string.
+
+    Parameters:
+        func_string (str): A string representation of a Python function.
+
+    Returns:
+        function: A callable Python function.
+    """
+    # Use exec to define the function in its own namespace. Generated code
+    # calls pd and np without importing them, as the app's globals had both.
+    namespace: dict = {"pd": pd, "np": np}
+    exec(func_string, namespace)
+
+    # Extract the function name from the string
+    func_name = func_string.split("(")[0].split()[-1]
+
+    # Return the function
+    return namespace[func_name]
+
+
+def convert_table(
+    convert_func: Callable[[pd.DataFrame], pd.DataFrame], table_df: pd.DataFrame
+) -> pd.DataFrame:
+    """Runs a conversion function on a table without copying it up front.
+    Copy-on-write, enabled when this module is imported, makes any in-place
+    edits by the function land on a private copy, so shared frames are never
+    modified. Compact frames are expanded first, see `expand_frame`."""
+    converted = convert_func(expand_frame(table_df).copy(deep=False))
+    converted.attrs = {}
+    return converted
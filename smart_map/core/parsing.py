@@ -1,15 +1,27 @@
 from io import BytesIO
-from typing import List, Any, Optional
+from typing import Iterator, List, Any, Optional, Type, Union
+import multiprocessing
+import os
 import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
-import docx2txt
 from langchain.docstore.document import Document
-import fitz
-from hashlib import md5
+
+from smart_map.core.bounded_cache import cached, content_hash
+from smart_map.core.caching import CACHE_POLICIES
 
 from abc import abstractmethod, ABC
 from copy import deepcopy
 
+# PDFs with at least this many pages are extracted across worker processes
+PARALLEL_MIN_PAGES = 64
+# Pages each worker extracts per task
+PAGES_PER_TASK = 16
+# Worker processes for page extraction, None for one per CPU
+PAGE_WORKERS: Optional[int] = None
+
 
 class File(ABC):
     """Represents an uploaded file comprised of Documents"""
@@ -28,8 +40,14 @@ class File(ABC):
 
     @classmethod
     @abstractmethod
+    def iter_docs(cls, file: BytesIO) -> Iterator[Document]:
+        """Yields the Documents of a BytesIO object as they are extracted"""
+
+    @classmethod
     def from_bytes(cls, file: BytesIO) -> "File":
         """Creates a File from a BytesIO object"""
+        docs = list(cls.iter_docs(file))
+        return cls(name=file.name, id=content_hash(file), docs=docs)
 
     def __repr__(self) -> str:
         return (
@@ -49,6 +67,15 @@ class File(ABC):
             docs=deepcopy(self.docs),
         )
 
+    def with_docs(self, docs: List[Document]) -> "File":
+        """Create a copy of this File with other docs, without copying its own"""
+        return self.__class__(
+            name=self.name,
+            id=self.id,
+            metadata=deepcopy(self.metadata),
+            docs=docs,
+        )
+
 
 def strip_consecutive_newlines(text: str) -> str:
     """Strips consecutive newlines from a string
@@ -57,49 +84,113 @@ def strip_consecutive_newlines(text: str) -> str:
     return re.sub(r"\s*\n\s*", "\n", text)
 
 
+def _read_bytes(file: BytesIO) -> bytes:
+    file.seek(0)
+    data = file.read()
+    # Reading moves the file pointer, which can affect caching
+    file.seek(0)
+    return data
+
+
 class DocxFile(File):
     @classmethod
-    def from_bytes(cls, file: BytesIO) -> "DocxFile":
+    def iter_docs(cls, file: BytesIO) -> Iterator[Document]:
+        import docx2txt
+
+        file.seek(0)
         text = docx2txt.process(file)
+        file.seek(0)
         text = strip_consecutive_newlines(text)
-        doc = Document(page_content=text.strip())
-        return cls(name=file.name, id=md5(file.read()).hexdigest(), docs=[doc])
+        yield Document(page_content=text.strip())
+
+
+def _page_text(page: Any) -> str:
+    return strip_consecutive_newlines(page.get_text(sort=True)).strip()
+
+
+def _extract_pages(path: str, start: int, stop: int) -> List[str]:
+    """Text of pages [start, stop) of a PDF, run in a worker process"""
+    import fitz
+
+    with fitz.open(path) as pdf:  # type: ignore
+        return [_page_text(pdf[i]) for i in range(start, stop)]
+
+
+@lru_cache(maxsize=None)
+def _page_pool() -> ProcessPoolExecutor:
+    """Worker processes for page extraction, started once per process"""
+    return ProcessPoolExecutor(
+        max_workers=PAGE_WORKERS,
+        mp_context=multiprocessing.get_context("forkserver"),
+    )
+
+
+def _iter_page_texts(data: bytes) -> Iterator[str]:
+    import fitz
+
+    pdf = fitz.open(stream=data, filetype="pdf")  # type: ignore
+    workers = PAGE_WORKERS or os.cpu_count() or 1
+    if pdf.page_count < PARALLEL_MIN_PAGES or workers < 2:
+        for page in pdf:
+            yield _page_text(page)
+        return
+
+    # Workers open the PDF from a temporary file rather than each receiving a
+    # copy of it, and extract contiguous page ranges that map() returns in order
+    page_count = pdf.page_count
+    pdf.close()
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(data)
+    try:
+        starts = range(0, page_count, PAGES_PER_TASK)
+        for texts in _page_pool().map(
+            _extract_pages,
+            [tmp.name] * len(starts),
+            starts,
+            [min(start + PAGES_PER_TASK, page_count) for start in starts],
+        ):
+            yield from texts
+    finally:
+        os.remove(tmp.name)
 
 
 class PdfFile(File):
     @classmethod
-    def from_bytes(cls, file: BytesIO) -> "PdfFile":
-        pdf = fitz.open(stream=file.read(), filetype="pdf")  # type: ignore
-        docs = []
-        for i, page in enumerate(pdf):
-            text = page.get_text(sort=True)
-            text = strip_consecutive_newlines(text)
-            doc = Document(page_content=text.strip())
-            doc.metadata["page"] = i + 1
-            docs.append(doc)
-        # file.read() mutates the file object, which can affect caching
-        # so we need to reset the file pointer to the beginning
-        file.seek(0)
-        return cls(name=file.name, id=md5(file.read()).hexdigest(), docs=docs)
+    def iter_docs(cls, file: BytesIO) -> Iterator[Document]:
+        for i, text in enumerate(_iter_page_texts(_read_bytes(file))):
+            yield Document(page_content=text, metadata={"page": i + 1})
 
 
 class TxtFile(File):
     @classmethod
-    def from_bytes(cls, file: BytesIO) -> "TxtFile":
-        text = file.read().decode("utf-8")
+    def iter_docs(cls, file: BytesIO) -> Iterator[Document]:
+        text = _read_bytes(file).decode("utf-8")
         text = strip_consecutive_newlines(text)
-        file.seek(0)
-        doc = Document(page_content=text.strip())
-        return cls(name=file.name, id=md5(file.read()).hexdigest(), docs=[doc])
+        yield Document(page_content=text.strip())
 
 
-def read_file(file: BytesIO) -> File:
-    """Reads an uploaded file and returns a File object"""
+def _file_type(file: BytesIO) -> Type[File]:
     if file.name.lower().endswith(".docx"):
-        return DocxFile.from_bytes(file)
+        return DocxFile
     elif file.name.lower().endswith(".pdf"):
-        return PdfFile.from_bytes(file)
+        return PdfFile
     elif file.name.lower().endswith(".txt"):
-        return TxtFile.from_bytes(file)
+        return TxtFile
     else:
         raise NotImplementedError(f"File type {file.name.split('.')[-1]} not supported")
+
+
+@cached(CACHE_POLICIES["read_file"], "read_file")
+def _read_file(file: BytesIO) -> File:
+    return _file_type(file).from_bytes(file)
+
+
+def read_file(file: BytesIO, stream: bool = False) -> Union[File, Iterator[Document]]:
+    """Reads an uploaded file and returns a File object.
+
+    With `stream` it instead returns an iterator over the file's Documents,
+    yielded page by page as they are extracted and not cached.
+    """
+    if stream:
+        return _file_type(file).iter_docs(file)
+    return _read_file(file)
@@ -1,18 +1,64 @@
-from typing import Any, List
+from functools import lru_cache
+from typing import Any, List, Tuple
+from langchain.chains.combine_documents.base import BaseCombineDocumentsChain
 from langchain.chains.qa_with_sources import load_qa_with_sources_chain
-from knowledge_gpt.core.prompts import STUFF_PROMPT
+from smart_map.core.prompts import STUFF_PROMPT
 from langchain.docstore.document import Document
 from langchain.chat_models import ChatOpenAI
-from knowledge_gpt.core.embedding import FolderIndex
-from knowledge_gpt.core.debug import FakeChatModel
+from smart_map.core.embedding import FolderIndex
+from smart_map.core.debug import FakeChatModel
+from smart_map.core.bounded_cache import CACHES, BoundedCache, make_key
+from smart_map.core.caching import CACHE_POLICIES
 from pydantic import BaseModel
 
+# Answers by query, model and the version of the index they were computed from
+_answers = BoundedCache("query_folder", CACHE_POLICIES["query_folder"])
+CACHES[_answers.name] = _answers
+
 
 class AnswerWithSources(BaseModel):
     answer: str
     sources: List[Document]
 
 
+def _create_chain(model: str, **model_kwargs: Any) -> BaseCombineDocumentsChain:
+    supported_models = {
+        "openai": ChatOpenAI,
+        "debug": FakeChatModel,
+    }
+
+    if model in supported_models:
+        llm = supported_models[model](**model_kwargs)
+    else:
+        raise ValueError(f"Model {model} not supported.")
+
+    return load_qa_with_sources_chain(
+        llm=llm,
+        chain_type="stuff",
+        prompt=STUFF_PROMPT,
+    )
+
+
+@lru_cache(maxsize=8)
+def _shared_chain(
+    model: str, model_kwargs: Tuple[Tuple[str, Any], ...]
+) -> BaseCombineDocumentsChain:
+    return _create_chain(model, **dict(model_kwargs))
+
+
+def get_qa_chain(
+    model: str = "openai", **model_kwargs: Any
+) -> BaseCombineDocumentsChain:
+    """Returns the question answering chain for a model, built once per process.
+
+    Fake models count the responses they have returned, so each call gets a
+    fresh chain for those.
+    """
+    if model == "openai":
+        return _shared_chain(model, tuple(sorted(model_kwargs.items())))
+    return _create_chain(model, **model_kwargs)
+
+
 def query_folder(
     query: str,
     folder_index: FolderIndex,
@@ -22,6 +68,8 @@ def query_folder(
 ) -> AnswerWithSources:
     """Queries a folder index for an answer.
 
+    Answers are cached until the index changes, so callers must not modify them.
+
     Args:
         query (str): The query to search for.
         folder_index (FolderIndex): The folder index to search.
@@ -33,23 +81,22 @@ def query_folder(
     Returns:
         AnswerWithSources: The answer and the source documents.
     """
-    supported_models = {
-        "openai": ChatOpenAI,
-        "debug": FakeChatModel,
-    }
+    key = make_key(
+        (query, folder_index.uid, folder_index.version, return_all, model),
+        model_kwargs,
+    )
+    found, answer = _answers.get(key)
+    if found:
+        return answer
 
-    if model in supported_models:
-        llm = supported_models[model](**model_kwargs)
-    else:
-        raise ValueError(f"Model {model} not supported.")
+    chain = get_qa_chain(model, **model_kwargs)
 
-    chain = load_qa_with_sources_chain(
-        llm=llm,
-        chain_type="stuff",
-        prompt=STUFF_PROMPT,
+    # An index of an empty folder has no vector store
+    relevant_docs = (
+        folder_index.index.similarity_search(query, k=5)
+        if folder_index.index is not None
+        else []
     )
-
-    relevant_docs = folder_index.index.similarity_search(query, k=5)
     result = chain(
         {"input_documents": relevant_docs, "question": query}, return_only_outputs=True
     )
@@ -58,20 +105,20 @@ def query_folder(
     if not return_all:
         sources = get_sources(result["output_text"], folder_index)
 
-    answer = result["output_text"].split("SOURCES: ")[0]
-
-    return AnswerWithSources(answer=answer, sources=sources)
+    answer = AnswerWithSources(
+        answer=result["output_text"].split("SOURCES: ")[0], sources=sources
+    )
+    _answers.set(key, answer)
+    return answer
 
 
 def get_sources(answer: str, folder_index: FolderIndex) -> List[Document]:
     """Retrieves the docs that were used to answer the question the generated answer."""
 
-    source_keys = [s for s in answer.split("SOURCES: ")[-1].split(", ")]
+    source_keys = dict.fromkeys(answer.split("SOURCES: ")[-1].split(", "))
 
     source_docs = []
-    for file in folder_index.files:
-        for doc in file.docs:
-            if doc.metadata["source"] in source_keys:
-                source_docs.append(doc)
+    for key in source_keys:
+        source_docs.extend(folder_index.sources.get(key, []))
 
     return source_docs
@@ -0,0 +1,270 @@
+import os
+import pickle
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, MutableMapping, Optional
+from uuid import uuid4
+
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+from smart_map.core.bounded_cache import estimate_nbytes
+
+MB = 1024**2
+
+# Per-session resident memory above which the largest values are spilled to disk
+MAX_SESSION_BYTES = 64 * MB
+# Values smaller than this always stay in memory
+MIN_SPILL_BYTES = 1 * MB
+# Sessions not accessed for this many seconds are dropped, including spill files
+IDLE_TIMEOUT = 30 * 60
+
+_MISSING = object()
+
+
+@dataclass
+class _Entry:
+    value: Any
+    nbytes: int
+    path: Optional[str] = None
+    dtypes: Optional[pd.Series] = None
+    shared: bool = False
+    # Cleared when writing the value to disk failed, so it is not retried
+    spillable: bool = True
+
+    @property
+    def resident(self) -> bool:
+        return self.path is None
+
+
+@dataclass
+class SessionStoreStats:
+    sessions: int = 0
+    resident_bytes: int = 0
+    spilled_bytes: int = 0
+    spills: int = 0
+    reloads: int = 0
+    evicted_sessions: int = 0
+
+
+class SessionStore:
+    """Holds heavy per-session objects outside of `st.session_state`.
+
+    Each session's resident memory is capped: when a session goes over
+    `max_session_bytes`, its largest values are written to disk (DataFrames as
+    Arrow IPC files that are memory-mapped when read back, everything else
+    pickled) and reloaded lazily the next time they are accessed. Sessions that
+    have been idle for longer than `idle_timeout` are dropped entirely.
+
+    Values set with `shared=True` are also held elsewhere, such as in a cache
+    shared between sessions. Spilling them would free no memory, so they are
+    kept by reference and not counted against the session.
+    """
+
+    def __init__(
+        self,
+        max_session_bytes: int = MAX_SESSION_BYTES,
+        min_spill_bytes: int = MIN_SPILL_BYTES,
+        idle_timeout: float = IDLE_TIMEOUT,
+        spill_dir: Optional[str] = None,
+    ):
+        self.max_session_bytes = max_session_bytes
+        self.min_spill_bytes = min_spill_bytes
+        self.idle_timeout = idle_timeout
+        self.spill_dir = spill_dir or tempfile.mkdtemp(prefix="smart_map_sessions_")
+        self.stats = SessionStoreStats()
+        self._sessions: Dict[str, Dict[str, _Entry]] = {}
+        self._last_access: Dict[str, float] = {}
+        self._lock = threading.RLock()
+
+    def get(self, session_id: str, key: str, default: Any = None) -> Any:
+        with self._lock:
+            self._touch(session_id)
+            entry = self._sessions[session_id].get(key)
+            if entry is None:
+                return default
+            if not entry.resident:
+                self._reload(entry)
+                self._enforce_cap(session_id, keep=key)
+            return entry.value
+
+    def set(
+        self, session_id: str, key: str, value: Any, shared: bool = False
+    ) -> None:
+        with self._lock:
+            self._touch(session_id)
+            entries = self._sessions[session_id]
+            if key in entries:
+                self._discard(entries.pop(key))
+            nbytes = 0 if shared else estimate_nbytes(value)
+            entry = _Entry(value=value, nbytes=nbytes, shared=shared)
+            entries[key] = entry
+            self.stats.resident_bytes += entry.nbytes
+            self._enforce_cap(session_id, keep=key)
+
+    def contains(self, session_id: str, key: str) -> bool:
+        with self._lock:
+            return key in self._sessions.get(session_id, {})
+
+    def session_nbytes(self, session_id: str) -> int:
+        """Resident bytes held for a session, not counting spilled values"""
+        with self._lock:
+            entries = self._sessions.get(session_id, {}).values()
+            return sum(e.nbytes for e in entries if e.resident)
+
+    def drop_session(self, session_id: str) -> None:
+        with self._lock:
+            for entry in self._sessions.pop(session_id, {}).values():
+                self._discard(entry)
+            self._last_access.pop(session_id, None)
+            self.stats.sessions = len(self._sessions)
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Drops every session idle for longer than the timeout"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            idle = [
+                session_id
+                for session_id, last in self._last_access.items()
+                if now - last > self.idle_timeout
+            ]
+            for session_id in idle:
+                self.drop_session(session_id)
+            self.stats.evicted_sessions += len(idle)
+            return len(idle)
+
+    def _touch(self, session_id: str) -> None:
+        now = time.monotonic()
+        self._last_access[session_id] = now
+        self._sessions.setdefault(session_id, {})
+        self.evict_idle(now)
+        self.stats.sessions = len(self._sessions)
+
+    def _enforce_cap(self, session_id: str, keep: str) -> None:
+        entries = self._sessions[session_id]
+        candidates = sorted(
+            (
+                (k, e)
+                for k, e in entries.items()
+                if e.resident
+                and e.spillable
+                and not e.shared
+                and k != keep
+                and e.nbytes >= self.min_spill_bytes
+            ),
+            key=lambda item: item[1].nbytes,
+            reverse=True,
+        )
+        for key, entry in candidates:
+            if self.session_nbytes(session_id) <= self.max_session_bytes:
+                break
+            self._spill(session_id, key, entry)
+
+    def _spill(self, session_id: str, key: str, entry: _Entry) -> None:
+        base = os.path.join(self.spill_dir, f"{session_id}-{key}")
+        try:
+            if isinstance(entry.value, pd.DataFrame):
+                path = base + ".arrow"
+                table = pa.Table.from_pandas(entry.value)
+                with pa.OSFile(path, "wb") as sink:
+                    with pa.ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+                entry.dtypes = entry.value.dtypes
+            else:
+                path = base + ".pkl"
+                with open(path, "wb") as f:
+                    pickle.dump(entry.value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            # Values that cannot be written, e.g. frames with duplicate column
+            # names or when the disk is full, stay in memory
+            for partial in (base + ".arrow", base + ".pkl"):
+                if os.path.exists(partial):
+                    os.remove(partial)
+            entry.spillable = False
+            return
+        entry.path, entry.value = path, None
+        self.stats.resident_bytes -= entry.nbytes
+        self.stats.spilled_bytes += entry.nbytes
+        self.stats.spills += 1
+
+    def _reload(self, entry: _Entry) -> None:
+        path = entry.path
+        assert path is not None
+        if path.endswith(".arrow"):
+            with pa.memory_map(path) as source:
+                value = pa.ipc.open_file(source).read_all().to_pandas()
+            for column, dtype in entry.dtypes.items():
+                if value[column].dtype != dtype:
+                    value[column] = value[column].astype(dtype)
+        else:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        os.remove(path)
+        entry.value, entry.path, entry.dtypes = value, None, None
+        self.stats.spilled_bytes -= entry.nbytes
+        self.stats.resident_bytes += entry.nbytes
+        self.stats.reloads += 1
+
+    def _discard(self, entry: _Entry) -> None:
+        if entry.resident:
+            self.stats.resident_bytes -= entry.nbytes
+        else:
+            self.stats.spilled_bytes -= entry.nbytes
+            if os.path.exists(entry.path):
+                os.remove(entry.path)
+
+
+class SessionView(MutableMapping):
+    """Dict-like view of one session's values in a SessionStore"""
+
+    def __init__(self, store: SessionStore, session_id: str):
+        self.store = store
+        self.session_id = session_id
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.store.get(self.session_id, key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.store.set(self.session_id, key, value)
+
+    def share(self, key: str, value: Any) -> None:
+        """Sets a value that is held elsewhere too, see SessionStore"""
+        self.store.set(self.session_id, key, value, shared=True)
+
+    def __delitem__(self, key: str) -> None:
+        with self.store._lock:
+            entries = self.store._sessions.get(self.session_id, {})
+            if key not in entries:
+                raise KeyError(key)
+            self.store._discard(entries.pop(key))
+
+    def __contains__(self, key: object) -> bool:
+        return self.store.contains(self.session_id, str(key))
+
+    def __iter__(self):
+        with self.store._lock:
+            return iter(list(self.store._sessions.get(self.session_id, {})))
+
+    def __len__(self) -> int:
+        with self.store._lock:
+            return len(self.store._sessions.get(self.session_id, {}))
+
+
+@st.cache_resource(show_spinner=False)
+def get_session_store() -> SessionStore:
+    """The store shared by all sessions of this server process"""
+    return SessionStore()
+
+
+def current_session() -> SessionView:
+    """The SessionView for the running Streamlit session. Only its id is kept in
+    `st.session_state`."""
+    if "session_id" not in st.session_state:
+        st.session_state["session_id"] = uuid4().hex
+    return SessionView(get_session_store(), st.session_state["session_id"])
@@ -0,0 +1,30 @@
+from io import StringIO
+
+import pandas as pd
+
+from smart_map.core.bounded_cache import cached
+from smart_map.core.caching import CACHE_POLICIES
+from smart_map.core.frames import compact_frame, frame_nbytes
+
+
+def read_table(template_file):
+    temp_stringio = StringIO(template_file.getvalue().decode("utf-8"))
+    template_string = temp_stringio.read()
+    template_df = pd.read_csv(template_file)
+    return template_string, template_df
+
+
+@cached(CACHE_POLICIES["load_template"], "load_template")
+def load_template(template_file):
+    """Loads a table that is shared, not copied, between sessions.
+    Callers must only modify it under copy-on-write, see `convert_table`."""
+    return read_table(template_file)
+
+
+@cached(CACHE_POLICIES["load_template_compact"], "load_template_compact")
+def load_template_compact(template_file):
+    """Like `load_template`, but the shared frame is compacted"""
+    template_string, template_df = read_table(template_file)
+    compact_df = compact_frame(template_df)
+    compact_df.attrs["nbytes_before"] = frame_nbytes(template_df)
+    return template_string, compact_df
@@ -0,0 +1,330 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+NUMERIC = "numeric"
+DATETIME = "datetime"
+BOOLEAN = "boolean"
+STRING = "string"
+
+CHECKS = ("dtype", "pattern", "range")
+
+_TRUE_FALSE = {"true", "false", "t", "f", "yes", "no", "y", "n", "0", "1"}
+
+
+@dataclass
+class ColumnRule:
+    """Expectations for a single template column"""
+
+    name: str
+    kind: str
+    pattern: Optional[str] = None
+    min_value: Optional[float] = None
+    max_value: Optional[float] = None
+    max_null_rate: float = 1.0
+
+
+@dataclass
+class ColumnReport:
+    """Violations found for a single column of the converted table"""
+
+    name: str
+    violations: Dict[str, int] = field(default_factory=dict)
+    null_count: int = 0
+    null_rate: float = 0.0
+    null_rate_exceeded: bool = False
+    samples: List = field(default_factory=list)
+
+    @property
+    def total_violations(self) -> int:
+        return sum(self.violations.values())
+
+    @property
+    def ok(self) -> bool:
+        return self.total_violations == 0 and not self.null_rate_exceeded
+
+
+@dataclass
+class ValidationReport:
+    """Result of validating a converted table against its template"""
+
+    n_rows: int = 0
+    missing_columns: List[str] = field(default_factory=list)
+    extra_columns: List[str] = field(default_factory=list)
+    # Names that occur more than once; only the first occurrence is checked
+    duplicate_columns: List[str] = field(default_factory=list)
+    columns: Dict[str, ColumnReport] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return (
+            not self.missing_columns
+            and not self.extra_columns
+            and not self.duplicate_columns
+            and all(c.ok for c in self.columns.values())
+        )
+
+    def summary(self) -> pd.DataFrame:
+        """One row per column with the violation counts for each check"""
+        rows = []
+        for col in self.columns.values():
+            if col.name in self.missing_columns:
+                continue
+            row = {"column": col.name}
+            row.update({check: col.violations.get(check, 0) for check in CHECKS})
+            row["null_rate"] = round(col.null_rate, 4)
+            row["null_rate_exceeded"] = col.null_rate_exceeded
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+
+def _value_shape(value: str) -> str:
+    """Generalizes a value into a regex describing its character classes.
+    Runs of digits, letters or spaces match any length and punctuation is kept,
+    e.g. "AB-1234" -> "[^\\W\\d_]+\\-\\d+"
+    """
+    parts = []
+    prev = None
+    for char in value:
+        if char.isdigit():
+            token = r"\d"
+        elif char.isalpha():
+            token = r"[^\W\d_]"
+        elif char.isspace():
+            token = r"\s"
+        else:
+            parts.append(re.escape(char))
+            prev = None
+            continue
+        if token != prev:
+            parts.append(f"{token}+")
+            prev = token
+    return "".join(parts)
+
+
+def _infer_pattern(values: pd.Series, max_shapes: int) -> Optional[str]:
+    shapes = values.astype(str).map(_value_shape).unique()
+    if len(shapes) == 0 or len(shapes) > max_shapes:
+        return None
+    return "|".join(f"(?:{s})" for s in sorted(shapes))
+
+
+def _infer_kind(values: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(values):
+        return BOOLEAN
+    if pd.api.types.is_numeric_dtype(values):
+        return NUMERIC
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return DATETIME
+    non_null = values.dropna().astype(str)
+    if non_null.empty:
+        return STRING
+    if non_null.str.lower().isin(_TRUE_FALSE).all() and non_null.nunique() <= 2:
+        return BOOLEAN
+    if pd.to_numeric(non_null, errors="coerce").notna().all():
+        return NUMERIC
+    if pd.to_datetime(non_null, errors="coerce", format="mixed").notna().all():
+        return DATETIME
+    return STRING
+
+
+def infer_rules(
+    template_df: pd.DataFrame,
+    range_tolerance: float = 1.0,
+    null_rate_tolerance: float = 0.05,
+    max_shapes: int = 5,
+    min_distinct: int = 10,
+) -> List[ColumnRule]:
+    """Derives per-column validation rules from the template table.
+
+    Templates usually hold only a few example rows, so value patterns and
+    numeric ranges are only inferred for columns with at least `min_distinct`
+    distinct values; other columns are only checked for their kind and nulls.
+
+    Args:
+        template_df (pd.DataFrame): The template table.
+        range_tolerance (float): Fraction of the template's value span by which
+        the accepted numeric range is widened on each side.
+        null_rate_tolerance (float): How much the null rate of the converted
+        column may exceed the template's null rate.
+        max_shapes (int): Maximum number of distinct value shapes for which a
+        regex pattern is inferred; more varied columns get no pattern check.
+        min_distinct (int): Minimum number of distinct non-null template values
+        for a pattern or range to be inferred.
+
+    Returns:
+        List[ColumnRule]: One rule per template column, in template order.
+    """
+    rules = []
+    for name in template_df.columns:
+        values = template_df[name]
+        non_null = values.dropna()
+        kind = _infer_kind(values)
+        rule = ColumnRule(
+            name=str(name),
+            kind=kind,
+            max_null_rate=min(1.0, values.isna().mean() + null_rate_tolerance),
+        )
+        if non_null.nunique() < min_distinct:
+            rules.append(rule)
+            continue
+        if kind == NUMERIC:
+            numbers = pd.to_numeric(non_null, errors="coerce")
+            low, high = float(numbers.min()), float(numbers.max())
+            margin = (high - low) * range_tolerance
+            rule.min_value, rule.max_value = low - margin, high + margin
+        if kind in (STRING, DATETIME):
+            rule.pattern = _infer_pattern(non_null, max_shapes)
+        rules.append(rule)
+    return rules
+
+
+def _bad_values_mask(values: pd.Series, is_bad) -> np.ndarray:
+    """Evaluates `is_bad` once per distinct non-null value and broadcasts the
+    result back, which is much cheaper than parsing every row of repetitive data
+    """
+    uniques = pd.Series(values.dropna().unique())
+    if uniques.empty:
+        return np.zeros(len(values), dtype=bool)
+    bad_uniques = uniques[is_bad(uniques).to_numpy(dtype=bool)]
+    return values.isin(bad_uniques).to_numpy(dtype=bool)
+
+
+def _kind_mask(values: pd.Series, kind: str) -> np.ndarray:
+    """Boolean mask of non-null values that are not of the expected kind"""
+    if kind == NUMERIC and not pd.api.types.is_numeric_dtype(values):
+        return _bad_values_mask(
+            values, lambda u: pd.to_numeric(u, errors="coerce").isna()
+        )
+    if kind == DATETIME and not pd.api.types.is_datetime64_any_dtype(values):
+        return _bad_values_mask(
+            values,
+            lambda u: pd.to_datetime(u, errors="coerce", format="mixed").isna(),
+        )
+    if kind == BOOLEAN and not pd.api.types.is_bool_dtype(values):
+        return _bad_values_mask(
+            values, lambda u: ~u.astype(str).str.lower().isin(_TRUE_FALSE)
+        )
+    return np.zeros(len(values), dtype=bool)
+
+
+def _check_chunk(
+    chunk: pd.DataFrame,
+    rules: List[ColumnRule],
+    report: ValidationReport,
+    sample_size: int,
+) -> None:
+    for rule in rules:
+        if rule.name not in chunk.columns:
+            continue
+        values = chunk[rule.name]
+        col_report = report.columns[rule.name]
+        col_report.null_count += int(values.isna().sum())
+
+        masks = {"dtype": _kind_mask(values, rule.kind)}
+        if rule.min_value is not None or rule.max_value is not None:
+            numbers = pd.to_numeric(values, errors="coerce")
+            out_of_range = (numbers < rule.min_value) | (numbers > rule.max_value)
+            masks["range"] = out_of_range.to_numpy(dtype=bool)
+        if rule.pattern is not None:
+            pattern = rule.pattern
+            masks["pattern"] = _bad_values_mask(
+                values, lambda u: ~u.astype(str).str.fullmatch(pattern)
+            )
+
+        bad_rows = np.zeros(len(values), dtype=bool)
+        for check, mask in masks.items():
+            count = int(mask.sum())
+            if count:
+                col_report.violations[check] = (
+                    col_report.violations.get(check, 0) + count
+                )
+                bad_rows |= mask
+
+        remaining = sample_size - len(col_report.samples)
+        if remaining > 0:
+            positions = np.flatnonzero(bad_rows)[:remaining]
+            col_report.samples.extend(chunk.index[positions].tolist())
+
+
+def _iter_chunks(
+    data: Union[pd.DataFrame, Iterable[pd.DataFrame]], chunk_size: int
+) -> Iterator[pd.DataFrame]:
+    if isinstance(data, pd.DataFrame):
+        for start in range(0, len(data), chunk_size):
+            yield data.iloc[start : start + chunk_size]
+    else:
+        yield from data
+
+
+def _check_columns(
+    report: ValidationReport, expected: List[str], columns: Iterable
+) -> None:
+    actual = [str(c) for c in columns]
+    report.missing_columns = [c for c in expected if c not in actual]
+    report.extra_columns = [c for c in dict.fromkeys(actual) if c not in expected]
+    report.duplicate_columns = [
+        c for c in dict.fromkeys(actual) if actual.count(c) > 1
+    ]
+
+
+def validate_table(
+    data: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+    rules: List[ColumnRule],
+    chunk_size: int = 100_000,
+    sample_size: int = 5,
+) -> ValidationReport:
+    """Validates a converted table against template rules, chunk by chunk.
+
+    Only one chunk's worth of boolean masks is alive at a time, so memory use
+    is bounded by `chunk_size` rather than by the size of the table.
+
+    Args:
+        data (pd.DataFrame | Iterable[pd.DataFrame]): The converted table, or an
+        iterable of chunks of it such as `pd.read_csv(..., chunksize=n)`.
+        rules (List[ColumnRule]): The rules to check, see `infer_rules`.
+        chunk_size (int): Number of rows checked at a time when `data` is a
+        DataFrame.
+        sample_size (int): Maximum number of offending row labels kept per column.
+
+    Returns:
+        ValidationReport: Per-column violation counts and sample row labels.
+    """
+    expected = [rule.name for rule in rules]
+    report = ValidationReport(
+        columns={name: ColumnReport(name=name) for name in expected}
+    )
+    checked_columns = False
+    for chunk in _iter_chunks(data, chunk_size):
+        if not checked_columns:
+            _check_columns(report, expected, chunk.columns)
+            checked_columns = True
+        chunk = chunk.rename(columns=str)
+        if chunk.columns.has_duplicates:
+            chunk = chunk.loc[:, ~chunk.columns.duplicated()]
+        report.n_rows += len(chunk)
+        _check_chunk(chunk, rules, report, sample_size)
+    if not checked_columns:
+        # No rows, or no chunks at all, whose columns count as missing
+        columns = data.columns if isinstance(data, pd.DataFrame) else []
+        _check_columns(report, expected, columns)
+
+    for rule in rules:
+        col_report = report.columns[rule.name]
+        if rule.name in report.missing_columns or report.n_rows == 0:
+            continue
+        col_report.null_rate = col_report.null_count / report.n_rows
+        col_report.null_rate_exceeded = col_report.null_rate > rule.max_null_rate
+    return report
+
+
+def validate_against_template(
+    template_df: pd.DataFrame,
+    converted_df: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+    **kwargs,
+) -> ValidationReport:
+    """Infers rules from the template and validates the converted table"""
+    return validate_table(converted_df, infer_rules(template_df), **kwargs)
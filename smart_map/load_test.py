@@ -0,0 +1,285 @@
+"""Load test driving concurrent simulated SmartMap sessions.
+
+    python -m smart_map.load_test --sessions 1,10,50 --latency-mean 0.5
+
+Each simulated session goes through the same steps as a user of the app:
+upload the template and a table, run the mapping chains against the simulated
+LLM backend, convert and validate the table, and download the result. Like the
+app, every step is a rerun that loads both uploads again from new UploadedFile
+objects. For every session count the harness reports latency percentiles per
+step, throughput and memory per session.
+"""
+import argparse
+import itertools
+import json
+import os
+import resource
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+from streamlit.runtime.uploaded_file_manager import UploadedFile, UploadedFileRec
+
+from smart_map.core.debug import (
+    SAMPLE_CONVERSION_CODE,
+    SAMPLE_TEMPLATE,
+    FakeBackendConfig,
+    SimulatedChatModel,
+    sample_table,
+)
+from smart_map.core.jobs import percentiles
+from smart_map.core.mapping import (
+    build_tables_prompt,
+    convert_table,
+    create_chains,
+    create_function_from_string,
+)
+from smart_map.core.session_store import SessionStore, SessionView
+from smart_map.core.tables import load_template, load_template_compact
+from smart_map.core.validation import validate_against_template
+
+STEPS = ("upload", "mapping", "conversion", "download")
+
+
+# Streamlit numbers uploads with a process-wide counter
+_upload_ids = itertools.count(1)
+
+
+class SimulatedUpload:
+    """A file held by Streamlit's file uploader. As in the app, each rerun of the
+    script gets a new UploadedFile built from the same record."""
+
+    def __init__(self, content: str, name: str):
+        self.record = UploadedFileRec(
+            id=next(_upload_ids),
+            name=name,
+            type="text/csv",
+            data=content.encode("utf-8"),
+        )
+
+    def rerun(self) -> UploadedFile:
+        return UploadedFile(self.record)
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Peak rather than current RSS, in KB on Linux but bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler:
+    """Tracks the peak RSS while running in a background thread"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self) -> "RssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def run_session(
+    index: int,
+    backend: FakeBackendConfig,
+    store: SessionStore,
+    rows: int,
+    compact: bool,
+    think_time: float,
+) -> Dict[str, Any]:
+    """Runs one simulated session and returns its step timings"""
+    session = SessionView(store, uuid.uuid4().hex)
+    load = load_template_compact if compact else load_template
+    timings: Dict[str, float] = {}
+    template = SimulatedUpload(SAMPLE_TEMPLATE, "template.csv")
+    table = SimulatedUpload(sample_table(rows, start=index * rows), "table.csv")
+
+    def rerun() -> Tuple[str, pd.DataFrame, str, pd.DataFrame]:
+        """What the app does with the uploads at the top of every rerun"""
+        return load(template.rerun()) + load(table.rerun())
+
+    step = STEPS[0]
+    try:
+        started = time.perf_counter()
+        template_string, template_df, table_string, table_df = rerun()
+        session.share("template", template_string)
+        session.share("tableA", table_string)
+        timings["upload"] = time.perf_counter() - started
+        time.sleep(think_time)
+
+        step = "mapping"
+        started = time.perf_counter()
+        template_string, template_df, table_string, table_df = rerun()
+        chain = create_chains(SimulatedChatModel(backend=backend), verbose=False)
+        session["chain_output"] = chain(
+            build_tables_prompt(template_string, table_string)
+        )
+        timings["mapping"] = time.perf_counter() - started
+        time.sleep(think_time)
+
+        step = "conversion"
+        started = time.perf_counter()
+        template_string, template_df, table_string, table_df = rerun()
+        code = session["chain_output"]["code"]
+        converted = convert_table(create_function_from_string(code), table_df)
+        validate_against_template(template_df, converted)
+        session["converted"] = converted
+        timings["conversion"] = time.perf_counter() - started
+
+        step = "download"
+        started = time.perf_counter()
+        rerun()
+        session["converted"].to_csv(index=False).encode("utf-8")
+        timings["download"] = time.perf_counter() - started
+    except Exception as e:
+        return {"timings": timings, "error": f"{step}: {e.__class__.__name__}: {e}"}
+    return {"timings": timings, "error": None}
+
+
+def run_level(
+    sessions: int,
+    backend: FakeBackendConfig,
+    rows: int,
+    compact: bool,
+    think_time: float,
+) -> Dict[str, Any]:
+    """Runs `sessions` simulated sessions at once and summarizes them"""
+    store = SessionStore()
+    baseline = current_rss()
+    with RssSampler() as sampler, ThreadPoolExecutor(max_workers=sessions) as pool:
+        started = time.perf_counter()
+        results = list(
+            pool.map(
+                lambda i: run_session(i, backend, store, rows, compact, think_time),
+                range(sessions),
+            )
+        )
+        elapsed = time.perf_counter() - started
+    store_bytes = store.stats.resident_bytes + store.stats.spilled_bytes
+
+    completed = [r for r in results if r["error"] is None]
+    errors: Dict[str, int] = {}
+    for result in results:
+        if result["error"] is not None:
+            errors[result["error"]] = errors.get(result["error"], 0) + 1
+    return {
+        "sessions": sessions,
+        "completed": len(completed),
+        "errors": errors,
+        "elapsed_seconds": elapsed,
+        "throughput_sessions_per_second": len(completed) / elapsed,
+        "latency_seconds": {
+            "total": percentiles([sum(r["timings"].values()) for r in completed]),
+            **{
+                step: percentiles([r["timings"][step] for r in completed])
+                for step in STEPS
+            },
+        },
+        "rss_bytes_per_session": (sampler.peak - baseline) / sessions,
+        "session_store_bytes_per_session": store_bytes / sessions,
+    }
+
+
+def run(
+    session_counts: List[int],
+    backend: FakeBackendConfig,
+    rows: int = 1000,
+    compact: bool = False,
+    think_time: float = 0.0,
+) -> List[Dict[str, Any]]:
+    return [
+        run_level(n, backend, rows, compact, think_time) for n in session_counts
+    ]
+
+
+def _format_seconds(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.3f}"
+
+
+def print_report(report: List[Dict[str, Any]]) -> None:
+    header = (
+        f"{'sessions':>8} {'done':>5} {'errors':>6} {'sess/s':>7}"
+        f" {'p50':>7} {'p95':>7} {'p99':>7} {'map p95':>8} {'MB/sess':>8}"
+    )
+    print(header)
+    for level in report:
+        total = level["latency_seconds"]["total"]
+        print(
+            f"{level['sessions']:>8} {level['completed']:>5}"
+            f" {sum(level['errors'].values()):>6}"
+            f" {level['throughput_sessions_per_second']:>7.2f}"
+            f" {_format_seconds(total['p50']):>7}"
+            f" {_format_seconds(total['p95']):>7}"
+            f" {_format_seconds(total['p99']):>7}"
+            f" {_format_seconds(level['latency_seconds']['mapping']['p95']):>8}"
+            f" {level['rss_bytes_per_session'] / 1024**2:>8.2f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sessions", default="1,5,10,25", help="comma separated session counts"
+    )
+    parser.add_argument("--rows", type=int, default=1000, help="rows per table")
+    parser.add_argument("--compact", action="store_true", help="compact tables")
+    parser.add_argument(
+        "--think-time", type=float, default=0.0, help="seconds between steps"
+    )
+    parser.add_argument(
+        "--latency",
+        default="lognormal",
+        choices=["constant", "uniform", "exponential", "lognormal"],
+    )
+    parser.add_argument("--latency-mean", type=float, default=1.0)
+    parser.add_argument("--latency-spread", type=float, default=0.5)
+    parser.add_argument("--seconds-per-output-token", type=float, default=0.0)
+    parser.add_argument("--tokens-per-minute", type=float, default=None)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="print the full report")
+    args = parser.parse_args()
+
+    backend = FakeBackendConfig(
+        latency=args.latency,
+        latency_mean=args.latency_mean,
+        latency_spread=args.latency_spread,
+        seconds_per_output_token=args.seconds_per_output_token,
+        tokens_per_minute=args.tokens_per_minute,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    backend.responses = backend.responses[:-1] + [SAMPLE_CONVERSION_CODE]
+    report = run(
+        [int(n) for n in args.sessions.split(",")],
+        backend,
+        rows=args.rows,
+        compact=args.compact,
+        think_time=args.think_time,
+    )
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""Headless HTTP service running the mapping pipeline as asynchronous jobs.
+
+    python -m smart_map.service --port 8600 --workers 4
+
+Endpoints:
+    POST /jobs                  submit {"template": csv, "table": csv, ...}
+    GET  /jobs/<id>             job status, chain output and generated code
+    POST /jobs/<id>/approve     approve the generated code, or {"code": edited}
+    GET  /jobs/<id>/result      converted table as csv
+    GET  /metrics               job counts, throughput and latency percentiles
+    GET  /health
+
+Jobs run the Python code clients send or approve, so every endpoint except
+/health requires an `Authorization: Bearer <token>` header when the
+SMART_MAP_SERVICE_TOKEN environment variable is set, and the service refuses to
+listen beyond loopback without it.
+
+With --load-test N the service is started locally with the debug model and N
+jobs are pushed through it, so it runs without network access.
+"""
+import argparse
+import hmac
+import ipaddress
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+from smart_map.core.debug import SAMPLE_CONVERSION_CODE, SAMPLE_TEMPLATE, sample_table
+from smart_map.core.jobs import (
+    FAILED,
+    SUCCEEDED,
+    JobQueue,
+    JobRequest,
+    ResourceLimits,
+    WorkerPool,
+    percentiles,
+)
+
+MAX_REQUEST_BYTES = 100 * 1024**2
+TOKEN_ENV = "SMART_MAP_SERVICE_TOKEN"
+
+_JOB_PATH = re.compile(r"^/jobs/([0-9a-f]{32})(/approve|/result)?$")
+
+
+class MappingService(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        queue: JobQueue,
+        pool: WorkerPool,
+        token: Optional[str] = None,
+    ):
+        super().__init__(address, MappingRequestHandler)
+        self.queue = queue
+        self.pool = pool
+        self.token = token
+        self.started = time.time()
+
+
+class MappingRequestHandler(BaseHTTPRequestHandler):
+    server: MappingService
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # The default handler logs every request to stderr
+        pass
+
+    def _send_json(self, status: int, body: Any) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _authorized(self) -> bool:
+        """Checks the shared secret, answering 401 if it is wrong"""
+        token = self.server.token
+        if token is None:
+            return True
+        given = self.headers.get("Authorization", "").encode("utf-8")
+        if hmac.compare_digest(given, f"Bearer {token}".encode("utf-8")):
+            return True
+        self._send_json(401, {"error": "Missing or invalid token"})
+        return False
+
+    def _read_json(self) -> Optional[Dict[str, Any]]:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_REQUEST_BYTES:
+            self._send_json(413, {"error": "Request too large"})
+            return None
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            self._send_json(400, {"error": f"Invalid JSON: {e}"})
+            return None
+        if not isinstance(body, dict):
+            self._send_json(400, {"error": "Expected a JSON object"})
+            return None
+        return body
+
+    def do_GET(self) -> None:
+        queue = self.server.queue
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "workers": self.server.pool.workers})
+            return
+        if not self._authorized():
+            return
+        if self.path == "/metrics":
+            metrics = queue.metrics()
+            metrics["uptime_seconds"] = time.time() - self.server.started
+            self._send_json(200, metrics)
+            return
+        match = _JOB_PATH.match(self.path)
+        if match is None or match.group(2) == "/approve":
+            self._send_json(404, {"error": "Not found"})
+            return
+        job = queue.get(match.group(1))
+        if job is None:
+            self._send_json(404, {"error": "Job not found"})
+            return
+        if match.group(2) is None:
+            self._send_json(200, job)
+            return
+        if job["status"] != SUCCEEDED:
+            self._send_json(409, {"error": f"Job is {job['status']}"})
+            return
+        with open(queue.result_path(job["id"]), "rb") as f:
+            payload = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self) -> None:
+        queue = self.server.queue
+        if not self._authorized():
+            return
+        body = self._read_json()
+        if body is None:
+            return
+        if self.path == "/jobs":
+            try:
+                request = JobRequest.from_dict(body)
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            job_id = queue.submit(request)
+            self._send_json(202, {"id": job_id, "status": "queued"})
+            return
+        match = _JOB_PATH.match(self.path)
+        if match is None or match.group(2) != "/approve":
+            self._send_json(404, {"error": "Not found"})
+            return
+        code = body.get("code")
+        if code is not None and not isinstance(code, str):
+            self._send_json(400, {"error": "code must be a string"})
+            return
+        if not queue.approve(match.group(1), code):
+            self._send_json(409, {"error": "Job is not awaiting approval"})
+            return
+        self._send_json(202, {"id": match.group(1), "status": "queued"})
+
+
+def _is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def serve(
+    host: str,
+    port: int,
+    data_dir: str,
+    workers: int,
+    limits: ResourceLimits,
+    token: Optional[str] = None,
+) -> MappingService:
+    """Starts the worker pool and returns the (not yet serving) HTTP server.
+
+    Raises ValueError when asked to listen beyond loopback without a token,
+    as anyone who can reach the service could run code on the host.
+    """
+    if token is None and not _is_loopback(host):
+        raise ValueError(
+            f"Refusing to listen on {host} without a token, set {TOKEN_ENV}"
+        )
+    queue = JobQueue(data_dir)
+    pool = WorkerPool(queue, workers=workers, limits=limits)
+    pool.start()
+    return MappingService((host, port), queue, pool, token)
+
+
+def _request(url: str, body: Optional[dict] = None) -> Any:
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    request = urllib.request.Request(
+        url, data=data, headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def load_test(
+    jobs: int,
+    workers: int,
+    rows: int,
+    concurrency: int,
+    limits: ResourceLimits,
+    model: str = "debug",
+) -> Dict[str, Any]:
+    """Pushes `jobs` mapping jobs through a local service using a fake model"""
+    with tempfile.TemporaryDirectory(prefix="smart_map_load_test_") as data_dir:
+        server = serve("127.0.0.1", 0, data_dir, workers, limits)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        request = {
+            "template": SAMPLE_TEMPLATE,
+            "table": sample_table(rows),
+            "model": model,
+            "code": SAMPLE_CONVERSION_CODE,
+            "run_mapping": True,
+        }
+
+        def run_one(_) -> Dict[str, Any]:
+            submitted = time.perf_counter()
+            job_id = _request(f"{base}/jobs", request)["id"]
+            while True:
+                job = _request(f"{base}/jobs/{job_id}")
+                if job["status"] in (SUCCEEDED, FAILED):
+                    job["latency"] = time.perf_counter() - submitted
+                    return job
+                time.sleep(0.05)
+
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = list(executor.map(run_one, range(jobs)))
+            elapsed = time.perf_counter() - started
+            metrics = _request(f"{base}/metrics")
+        finally:
+            server.shutdown()
+            server.pool.stop()
+            server.queue.close()
+
+    failed = [job for job in results if job["status"] != SUCCEEDED]
+    return {
+        "jobs": jobs,
+        "workers": workers,
+        "rows_per_job": rows,
+        "failed": len(failed),
+        "errors": sorted({job["error"] for job in failed})[:5],
+        "elapsed_seconds": elapsed,
+        "throughput_per_second": jobs / elapsed,
+        "client_latency_seconds": percentiles([job["latency"] for job in results]),
+        "service_metrics": metrics,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--data-dir", default=".smart_map_service")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=ResourceLimits.timeout)
+    parser.add_argument("--memory-mb", type=int, default=ResourceLimits.memory_mb)
+    parser.add_argument("--cpu-seconds", type=int, default=None)
+    parser.add_argument(
+        "--load-test", type=int, metavar="JOBS", help="run a local load test"
+    )
+    parser.add_argument("--load-test-rows", type=int, default=1000)
+    parser.add_argument("--load-test-concurrency", type=int, default=8)
+    parser.add_argument(
+        "--load-test-model",
+        choices=["debug", "simulated"],
+        default="debug",
+        help="simulated adds latency, rate limits and errors, see FakeBackendConfig",
+    )
+    args = parser.parse_args()
+    limits = ResourceLimits(
+        timeout=args.timeout, memory_mb=args.memory_mb, cpu_seconds=args.cpu_seconds
+    )
+
+    if args.load_test:
+        report = load_test(
+            args.load_test,
+            args.workers,
+            args.load_test_rows,
+            args.load_test_concurrency,
+            limits,
+            args.load_test_model,
+        )
+        print(json.dumps(report, indent=2))
+        return
+
+    try:
+        server = serve(
+            args.host,
+            args.port,
+            args.data_dir,
+            args.workers,
+            limits,
+            token=os.environ.get(TOKEN_ENV) or None,
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Serving on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.pool.stop()
+        server.queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Benchmark of the app's cold start and per-rerun script overhead.
+
+    python -m smart_map.startup_benchmark --check
+
+Streamlit re-executes main.py top to bottom on every interaction. Each sample
+runs in a fresh interpreter and measures the time to import streamlit, the time
+to import the app's own dependencies, the first script run and the median of
+further reruns, with the script in bare mode (no uploads, debug backend). With
+--check the exit status is non-zero when a budget is exceeded or a heavy
+dependency is imported before it is needed.
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+# Regression budgets, in seconds
+APP_IMPORT_BUDGET = 0.5
+FIRST_RUN_BUDGET = 0.5
+RERUN_BUDGET = 0.05
+
+# Dependencies that should only load once the feature using them is used
+LAZY_MODULES = ("langchain", "openai", "fitz", "docx2txt", "tiktoken", "faiss")
+
+
+def measure(reruns: int) -> Dict[str, Any]:
+    """Runs in the child interpreter"""
+    os.environ.setdefault("SMART_MAP_BACKEND", "debug")
+    with open(MAIN_PATH) as f:
+        source = f.read()
+    tree = ast.parse(source)
+    imports = ast.Module(
+        body=[n for n in tree.body if isinstance(n, (ast.Import, ast.ImportFrom))],
+        type_ignores=[],
+    )
+
+    started = time.perf_counter()
+    import streamlit  # noqa: F401
+
+    streamlit_import = time.perf_counter() - started
+
+    started = time.perf_counter()
+    exec(compile(imports, MAIN_PATH, "exec"), {"__name__": "__imports__"})
+    app_import = time.perf_counter() - started
+
+    # A minimal script run context so session state persists across reruns,
+    # as it does for a user of the running app
+    from streamlit.runtime.scriptrunner import ScriptRunContext, add_script_run_ctx
+    from streamlit.runtime.state import SafeSessionState, SessionState
+    from streamlit.runtime.uploaded_file_manager import UploadedFileManager
+
+    ctx = ScriptRunContext(
+        session_id="startup-benchmark",
+        _enqueue=lambda msg: None,
+        query_string="",
+        session_state=SafeSessionState(SessionState()),
+        uploaded_file_mgr=UploadedFileManager(),
+        page_script_hash="",
+        user_info={},
+    )
+    add_script_run_ctx(threading.current_thread(), ctx)
+
+    script = compile(source, MAIN_PATH, "exec")
+    runs = []
+    for _ in range(reruns + 1):
+        ctx.reset()
+        started = time.perf_counter()
+        exec(script, {"__name__": "__main__", "__file__": MAIN_PATH})
+        runs.append(time.perf_counter() - started)
+
+    return {
+        "streamlit_import_seconds": streamlit_import,
+        "app_import_seconds": app_import,
+        "first_run_seconds": runs[0],
+        "rerun_seconds": statistics.median(runs[1:]) if reruns else None,
+        "lazy_modules_loaded": sorted(
+            name for name in LAZY_MODULES if name in sys.modules
+        ),
+    }
+
+
+def run(samples: int, reruns: int) -> Dict[str, Any]:
+    """Measures `samples` fresh interpreters and reports the medians"""
+    results: List[Dict[str, Any]] = []
+    for _ in range(samples):
+        child = subprocess.run(
+            [sys.executable, "-m", "smart_map.startup_benchmark", "--child"]
+            + ["--reruns", str(reruns)],
+            capture_output=True,
+            text=True,
+        )
+        if child.returncode != 0:
+            raise RuntimeError(f"Benchmark run failed:\n{child.stderr}")
+        results.append(json.loads(child.stdout.strip().splitlines()[-1]))
+    report: Dict[str, Any] = {
+        key: statistics.median(r[key] for r in results)
+        for key in (
+            "streamlit_import_seconds",
+            "app_import_seconds",
+            "first_run_seconds",
+            "rerun_seconds",
+        )
+        if results[0][key] is not None
+    }
+    report["lazy_modules_loaded"] = sorted(
+        {name for r in results for name in r["lazy_modules_loaded"]}
+    )
+    return report
+
+
+def check(report: Dict[str, Any]) -> List[str]:
+    """Returns the budgets the report exceeds"""
+    failures = []
+    for key, budget in (
+        ("app_import_seconds", APP_IMPORT_BUDGET),
+        ("first_run_seconds", FIRST_RUN_BUDGET),
+        ("rerun_seconds", RERUN_BUDGET),
+    ):
+        if report.get(key) is not None and report[key] > budget:
+            failures.append(f"{key} {report[key]:.3f}s exceeds budget {budget}s")
+    if report["lazy_modules_loaded"]:
+        failures.append(
+            "imported at startup: " + ", ".join(report["lazy_modules_loaded"])
+        )
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--check", action="store_true", help="enforce the budgets")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.reruns)))
+        return
+
+    report = run(args.samples, args.reruns)
+    print(json.dumps(report, indent=2))
+    if args.check:
+        failures = check(report)
+        for failure in failures:
+            print(f"FAIL: {failure}", file=sys.stderr)
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,20 @@
-from typing import List
+from typing import List, TYPE_CHECKING
 import streamlit as st
-from langchain.docstore.document import Document
-from smart_map.core.parsing import File
-import openai
+from smart_map.core.validation import ValidationReport
+from smart_map.core.frames import frame_nbytes, format_nbytes
+from smart_map.core.caching import CACHE_POLICIES
+from smart_map.core.bounded_cache import cached
 from streamlit.logger import get_logger
-from typing import NoReturn
+from typing import NoReturn, Optional
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+    from smart_map.core.parsing import File
 
 logger = get_logger(__name__)
 
 
-def wrap_doc_in_html(docs: List[Document]) -> str:
+def wrap_doc_in_html(docs: List["Document"]) -> str:
     """Wraps each page in document separated by newlines in <p> tags"""
     text = [doc.page_content for doc in docs]
     if isinstance(text, list):
@@ -25,7 +30,7 @@ def is_query_valid(query: str) -> bool:
     return True
 
 
-def is_file_valid(file: File) -> bool:
+def is_file_valid(file: "File") -> bool:
     if (
         len(file.docs) == 0
         or "".join([doc.page_content for doc in file.docs]).strip() == ""
@@ -42,11 +47,11 @@ def display_file_read_error(e: Exception) -> NoReturn:
     st.stop()
 
 
-@st.cache_data(show_spinner=False)
-def is_open_ai_key_valid(openai_api_key) -> bool:
-    if not openai_api_key:
-        st.error("Please enter your OpenAI API key in the sidebar!")
-        return False
+@cached(CACHE_POLICIES["is_open_ai_key_valid"], "is_open_ai_key_valid")
+def _open_ai_key_error(openai_api_key) -> Optional[str]:
+    """Returns the error from a test request with the key, or None if it works"""
+    import openai
+
     try:
         openai.ChatCompletion.create(
             model="gpt-3.5-turbo",
@@ -54,7 +59,57 @@ def is_open_ai_key_valid(openai_api_key) -> bool:
             api_key=openai_api_key,
         )
     except Exception as e:
-        st.error(f"{e.__class__.__name__}: {e}")
-        logger.error(f"{e.__class__.__name__}: {e}")
+        return f"{e.__class__.__name__}: {e}"
+    return None
+
+
+def is_open_ai_key_valid(openai_api_key) -> bool:
+    if not openai_api_key:
+        st.error("Please enter your OpenAI API key in the sidebar!")
+        return False
+    error = _open_ai_key_error(openai_api_key)
+    if error is not None:
+        st.error(error)
+        logger.error(error)
         return False
     return True
+
+
+def display_validation_report(report: ValidationReport, table) -> None:
+    """Shows the discrepancies between a converted table and the template"""
+    if report.ok:
+        st.success("Converted table matches the template")
+        return
+    if report.missing_columns:
+        st.warning(f"Missing template columns: {', '.join(report.missing_columns)}")
+    if report.extra_columns:
+        st.warning(f"Columns not in the template: {', '.join(report.extra_columns)}")
+    if report.duplicate_columns:
+        st.warning(
+            f"Columns that occur more than once: {', '.join(report.duplicate_columns)}"
+        )
+    st.dataframe(report.summary())
+    for col in report.columns.values():
+        if col.samples:
+            st.markdown(f"Sample offending rows for `{col.name}`")
+            st.write(table.loc[col.samples])
+
+
+def display_memory_usage(frames: dict) -> None:
+    """Shows the memory held by this session's tables, before and after compaction"""
+    rows = []
+    for name, df in frames.items():
+        after = frame_nbytes(df)
+        before = df.attrs.get("nbytes_before", after)
+        rows.append({"table": name, "before": before, "after": after})
+    total_before = sum(row["before"] for row in rows)
+    total_after = sum(row["after"] for row in rows)
+    st.caption(
+        f"Session memory: {format_nbytes(total_after)}"
+        f" ({format_nbytes(total_before)} before compaction)"
+    )
+    for row in rows:
+        st.caption(
+            f"{row['table']}: {format_nbytes(row['after'])}"
+            f" ({format_nbytes(row['before'])} before)"
+        )
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+from langchain.docstore.document import Document
+from langchain.vectorstores.faiss import FAISS
+from streamlit.runtime.uploaded_file_manager import UploadedFile, UploadedFileRec
+
+import smart_map.core.bounded_cache as bounded_cache
+from smart_map.core.bounded_cache import content_hash, estimate_nbytes
+from smart_map.core.debug import FakeEmbeddings
+from smart_map.core.embedding import FolderIndex
+from smart_map.core.parsing import TxtFile
+
+MB = 1024**2
+
+
+def test_upload_is_hashed_once_across_reruns(monkeypatch):
+    record = UploadedFileRec(
+        id=7, name="table.csv", type="text/csv", data=b"a,b\n1,2\n"
+    )
+    hashed = []
+    stream_md5 = bounded_cache._stream_md5
+    monkeypatch.setattr(
+        bounded_cache, "_stream_md5", lambda f: hashed.append(f) or stream_md5(f)
+    )
+    monkeypatch.setattr(bounded_cache, "_upload_hashes", bounded_cache.OrderedDict())
+
+    # Streamlit builds a new UploadedFile from the same record on every rerun
+    first = content_hash(UploadedFile(record))
+    second = content_hash(UploadedFile(record))
+
+    assert first == second
+    assert len(hashed) == 1
+
+
+def test_different_uploads_with_the_same_id_are_hashed_separately(monkeypatch):
+    monkeypatch.setattr(bounded_cache, "_upload_hashes", bounded_cache.OrderedDict())
+    a = UploadedFile(UploadedFileRec(id=1, name="a.csv", type="text/csv", data=b"a"))
+    b = UploadedFile(UploadedFileRec(id=1, name="b.csv", type="text/csv", data=b"b"))
+
+    assert content_hash(a) != content_hash(b)
+
+
+def test_upload_size_includes_its_contents():
+    data = b"x" * (5 * MB)
+    upload = UploadedFile(UploadedFileRec(id=1, name="a", type="text/csv", data=data))
+
+    assert estimate_nbytes(upload) >= 5 * MB
+    assert estimate_nbytes({"upload": upload}) >= 5 * MB
+
+
+def test_series_and_arrays_are_sized_deeply():
+    strings = pd.Series(["x" * 1000] * 100)
+
+    assert estimate_nbytes(strings) >= 100 * 1000
+    assert estimate_nbytes(np.zeros(MB, dtype=np.uint8)) >= MB
+
+
+def test_folder_index_size_includes_vectors_and_faiss_index():
+    docs = [
+        Document(page_content=f"chunk {i}", metadata={"source": f"1-{i}"})
+        for i in range(1000)
+    ]
+    file = TxtFile(name="a.txt", id="a", docs=docs)
+
+    folder_index = FolderIndex.from_files([file], FakeEmbeddings(), FAISS)
+
+    vectors = 1000 * 4 * 4
+    assert estimate_nbytes(folder_index) >= 2 * vectors + estimate_nbytes(file)
@@ -0,0 +1,20 @@
+import smart_map.core.tables  # noqa: F401  registers the table caches
+from smart_map.core.bounded_cache import CACHES, CachePolicy
+from smart_map.core.caching import CACHE_POLICIES, bootstrap_caching
+
+
+def test_every_cache_has_its_own_policy():
+    for name, cache in CACHES.items():
+        assert cache.policy is CACHE_POLICIES[name], name
+
+
+def test_overrides_apply_to_the_named_cache_only(monkeypatch):
+    for name in ("load_template", "load_template_compact"):
+        monkeypatch.setitem(CACHE_POLICIES, name, CACHE_POLICIES[name])
+        monkeypatch.setattr(CACHES[name], "policy", CACHES[name].policy)
+    policy = CachePolicy(max_entries=1)
+
+    bootstrap_caching({"load_template_compact": policy})
+
+    assert CACHES["load_template_compact"].policy is policy
+    assert CACHES["load_template"].policy is not policy
@@ -0,0 +1,92 @@
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+import tiktoken
+from langchain.docstore.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+import smart_map.core.chunking as chunking
+
+_GPT2_PATTERN = (
+    r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+"""
+)
+
+
+def _stand_in_encoding() -> tiktoken.Encoding:
+    """A small byte-level BPE, so the tests need no downloaded vocabulary"""
+    ranks = {bytes([i]): i for i in range(256)}
+    for merged in (b"th", b"he", b"in", b"er", b" t", b" th", b"the", b" the"):
+        ranks[merged] = len(ranks)
+    return tiktoken.Encoding(
+        name="stand-in",
+        pat_str=_GPT2_PATTERN,
+        mergeable_ranks=ranks,
+        special_tokens={"<|endoftext|>": len(ranks)},
+    )
+
+
+@pytest.fixture(autouse=True)
+def stand_in_tokenizer(monkeypatch):
+    encoding = _stand_in_encoding()
+    monkeypatch.setattr(tiktoken, "encoding_for_model", lambda model_name: encoding)
+    chunking.get_chunker.cache_clear()
+    yield
+    chunking.get_chunker.cache_clear()
+
+
+def _pages(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    words = "the insured shall notify their insurer within thirty days".split()
+    words += ["Ünïcode", "naïve", "claim-2023-0042", "x" * 120]
+    pages = []
+    for _ in range(n):
+        paragraphs = [
+            "\n".join(
+                " ".join(rng.choice(words) for _ in range(rng.randint(1, 30)))
+                for _ in range(rng.randint(1, 5))
+            )
+            for _ in range(rng.randint(1, 4))
+        ]
+        pages.append("\n\n".join(paragraphs))
+    return pages
+
+
+@pytest.mark.parametrize("chunk_size,chunk_overlap", [(20, 0), (50, 10), (300, 0)])
+def test_chunker_matches_recursive_character_splitter(chunk_size, chunk_overlap):
+    pages = _pages(40)
+    reference = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        model_name="gpt-3.5-turbo",
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+    )
+
+    chunker = chunking.get_chunker(chunk_size, chunk_overlap)
+
+    assert chunker.split_pages(pages) == [reference.split_text(p) for p in pages]
+
+
+def test_parallel_chunks_keep_page_order(monkeypatch):
+    docs = [
+        Document(page_content=text, metadata={"page": i + 1})
+        for i, text in enumerate(_pages(50, seed=1))
+    ]
+    serial = list(chunking.iter_chunks(docs, 40, parallel=False))
+
+    # Forked workers inherit the stand-in tokenizer
+    pool = ProcessPoolExecutor(2, mp_context=multiprocessing.get_context("fork"))
+    monkeypatch.setattr(chunking, "_chunk_pool", lambda: pool)
+    monkeypatch.setattr(chunking, "CHUNK_WORKERS", 2)
+    monkeypatch.setattr(chunking, "PAGES_PER_BATCH", 3)
+    try:
+        parallel = list(chunking.iter_chunks(docs, 40, parallel=True))
+    finally:
+        pool.shutdown()
+
+    assert [(d.page_content, d.metadata) for d in parallel] == [
+        (d.page_content, d.metadata) for d in serial
+    ]
+    assert [d.metadata["page"] for d in serial] == sorted(
+        d.metadata["page"] for d in serial
+    )
@@ -0,0 +1,120 @@
+from hashlib import md5
+from typing import List
+
+from langchain.docstore.document import Document
+from langchain.embeddings.base import Embeddings
+from langchain.vectorstores.faiss import FAISS
+
+from smart_map.core.embedding import CachedEmbeddings, FolderIndex, text_hash
+from smart_map.core.parsing import TxtFile
+
+
+class CountingEmbeddings(Embeddings):
+    """Deterministic vectors derived from the text, counting what is embedded"""
+
+    def __init__(self):
+        self.texts: List[str] = []
+        self.calls = 0
+
+    def _vector(self, text: str) -> List[float]:
+        digest = md5(text.encode("utf-8")).digest()
+        return [b / 255 for b in digest[:8]]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts.extend(texts)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vector(text)
+
+
+def _file(file_id: str, texts: List[str]) -> TxtFile:
+    docs = [
+        Document(page_content=text, metadata={"source": f"{file_id}-{i}"})
+        for i, text in enumerate(texts)
+    ]
+    return TxtFile(name=f"{file_id}.txt", id=file_id, docs=docs)
+
+
+def _indexed_texts(folder_index: FolderIndex) -> List[str]:
+    docstore = folder_index.index.docstore._dict
+    return sorted(doc.page_content for doc in docstore.values())
+
+
+def test_each_distinct_chunk_is_embedded_once_in_batches():
+    model = CountingEmbeddings()
+    embeddings = CachedEmbeddings(model, batch_size=2)
+    a = _file("a", ["alpha", "beta", "gamma", "alpha"])
+    b = _file("b", ["beta", "delta"])
+
+    folder_index = FolderIndex.from_files([a], embeddings, FAISS)
+    folder_index.add_files([b, a])
+
+    assert sorted(model.texts) == ["alpha", "beta", "delta", "gamma"]
+    assert model.calls == 3
+    assert folder_index.index.index.ntotal == 6
+    assert folder_index.version == 2
+    assert sorted(folder_index.sources) == ["a-0", "a-1", "a-2", "a-3", "b-0", "b-1"]
+
+
+def test_adding_an_indexed_file_again_changes_nothing():
+    folder_index = FolderIndex.from_files(
+        [_file("a", ["alpha"])], CountingEmbeddings(), FAISS
+    )
+
+    assert folder_index.add_files([_file("a", ["alpha"])]) == []
+    assert folder_index.version == 1
+
+
+def test_remove_files_reuses_vectors_and_prunes_unused_ones():
+    model = CountingEmbeddings()
+    a = _file("a", ["alpha", "beta"])
+    b = _file("b", ["beta", "gamma"])
+    folder_index = FolderIndex.from_files([a, b], model, FAISS)
+    embedded = len(model.texts)
+
+    assert folder_index.remove_files(["a", "missing"]) == ["a"]
+
+    assert len(model.texts) == embedded
+    assert _indexed_texts(folder_index) == ["beta", "gamma"]
+    assert set(folder_index.embeddings.vectors) == {
+        text_hash("beta"),
+        text_hash("gamma"),
+    }
+    assert sorted(folder_index.sources) == ["b-0", "b-1"]
+    assert [f.id for f in folder_index.files] == ["b"]
+    assert folder_index.version == 2
+
+    folder_index.remove_files(["b"])
+    assert folder_index.index is None
+    assert folder_index.embeddings.vectors == {}
+    assert folder_index.sources == {}
+
+
+def test_save_load_add_save_round_trip(tmp_path):
+    a = _file("a", ["alpha", "beta"])
+    saved = FolderIndex.from_files([a], CountingEmbeddings(), FAISS)
+    saved.save(str(tmp_path))
+
+    model = CountingEmbeddings()
+    loaded = FolderIndex.load(str(tmp_path), model, FAISS)
+    assert model.texts == []
+    assert loaded.version == saved.version
+    assert [f.id for f in loaded.files] == ["a"]
+    assert _indexed_texts(loaded) == ["alpha", "beta"]
+    query = model.embed_query("alpha")
+    assert loaded.index.similarity_search_by_vector(query, k=1)[0].page_content == (
+        "alpha"
+    )
+
+    loaded.add_files([_file("b", ["beta", "gamma"])])
+    assert model.texts == ["gamma"]
+    loaded.save(str(tmp_path))
+
+    reloaded = FolderIndex.load(str(tmp_path), CountingEmbeddings(), FAISS)
+    assert [f.id for f in reloaded.files] == ["a", "b"]
+    assert reloaded.version == saved.version + 1
+    assert _indexed_texts(reloaded) == ["alpha", "beta", "beta", "gamma"]
+    assert sorted(reloaded.sources) == ["a-0", "a-1", "b-0", "b-1"]
+    assert reloaded.index.index.ntotal == 4
@@ -0,0 +1,47 @@
+import pandas as pd
+
+from smart_map.core.frames import compact_frame
+from smart_map.core.mapping import convert_table, create_function_from_string
+
+
+def _table() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "state": ["CA", "NY", None, "CA"] * 25,
+            "age": [30, 45, 200, 61] * 25,
+            "premium": [12345.67, 99.99, 1000.0, 0.1] * 25,
+            "claims": [0.0, 1.0, 2.0, None] * 25,
+        }
+    )
+
+
+def test_generated_code_can_add_values_to_compacted_columns():
+    compact = compact_frame(_table())
+    assert isinstance(compact["state"].dtype, pd.CategoricalDtype)
+    code = """
+def convert(df):
+    df.loc[df["state"] == "CA", "state"] = "California"
+    df["state"] = df["state"].fillna("Unknown")
+    df["age_months"] = df["age"] * 12
+    return df
+"""
+
+    converted = convert_table(create_function_from_string(code), compact)
+
+    assert converted["state"].tolist()[:4] == [
+        "California",
+        "NY",
+        "Unknown",
+        "California",
+    ]
+    assert converted["age_months"].tolist()[:4] == [360, 540, 2400, 732]
+    assert compact["state"].value_counts().to_dict() == {"CA": 50, "NY": 25}
+    assert compact["age"].dtype == "uint8"
+
+
+def test_floats_are_narrowed_only_when_lossless():
+    compact = compact_frame(_table())
+
+    assert compact["premium"].dtype == "float64"
+    assert compact["premium"].tolist()[:4] == [12345.67, 99.99, 1000.0, 0.1]
+    assert compact["claims"].dtype == "float32"
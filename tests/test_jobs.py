@@ -0,0 +1,153 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from smart_map.core.debug import SAMPLE_CONVERSION_CODE, SAMPLE_TEMPLATE, sample_table
+from smart_map.core.jobs import (
+    FAILED,
+    SUCCEEDED,
+    JobQueue,
+    JobRequest,
+    ResourceLimits,
+    WorkerPool,
+)
+from smart_map.service import serve
+
+
+def _post(url, body, token=None):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    request = urllib.request.Request(
+        url, data=json.dumps(body).encode("utf-8"), headers=headers, method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def _wait(queue, job_id, timeout=60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in (SUCCEEDED, FAILED):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+
+def test_limits_are_coerced():
+    assert ResourceLimits.parse({"timeout": "5", "memory_mb": 512.0}) == {
+        "timeout": 5.0,
+        "memory_mb": 512,
+    }
+
+
+@pytest.mark.parametrize(
+    "limits",
+    ["5", {"timeout": "soon"}, {"timeout": -1}, {"timeout": True}, {"disk": 1}],
+)
+def test_invalid_limits_are_rejected(limits):
+    with pytest.raises(ValueError):
+        ResourceLimits.parse(limits)
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"table": "a\n1\n"},
+        {"template": ["a"], "table": "a\n1\n"},
+        {"template": "a\n", "table": "a\n1\n", "auto_approve": "yes"},
+        {"template": "a\n", "table": "a\n1\n", "code": 1},
+        {"template": "a\n", "table": "a\n1\n", "priority": 1},
+        {"template": "a\n", "table": "a\n1\n", "run_mapping": False},
+        {"template": "a\n", "table": "a\n1\n", "model": "gpt-5"},
+    ],
+)
+def test_invalid_requests_are_rejected(body):
+    with pytest.raises(ValueError):
+        JobRequest.from_dict(body)
+
+
+def test_service_returns_400_for_bad_input(tmp_path):
+    server = serve("127.0.0.1", 0, str(tmp_path), 1, ResourceLimits())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        status, body = _post(
+            f"{base}/jobs",
+            {"template": "a\n", "table": "a\n1\n", "limits": {"timeout": "x"}},
+        )
+        assert status == 400
+        assert "timeout" in body["error"]
+    finally:
+        server.shutdown()
+        server.pool.stop()
+        server.queue.close()
+
+
+def test_worker_survives_a_job_that_fails_to_start(tmp_path):
+    queue = JobQueue(str(tmp_path))
+    pool = WorkerPool(queue, workers=1)
+    # Bypasses from_dict, as a job queued by an older version could
+    bad = queue.submit(
+        JobRequest(template="a\n", table="a\n1\n", limits={"timeout": "5"})
+    )
+    good = queue.submit(
+        JobRequest(
+            template=SAMPLE_TEMPLATE,
+            table=sample_table(10),
+            code=SAMPLE_CONVERSION_CODE,
+        )
+    )
+    pool.start()
+    try:
+        assert _wait(queue, bad)["status"] == FAILED
+        assert _wait(queue, good)["status"] == SUCCEEDED
+    finally:
+        pool.stop()
+        queue.close()
+
+
+def test_throughput_is_not_diluted_just_after_startup(tmp_path):
+    queue = JobQueue(str(tmp_path))
+    try:
+        for _ in range(4):
+            job_id = queue.submit(JobRequest(template="a\n", table="a\n1\n", code=""))
+            queue.claim(timeout=0)
+            queue.finish(job_id, {"status": SUCCEEDED, "result_rows": 1})
+        time.sleep(0.1)
+        metrics = queue.metrics(window=300.0)
+        assert metrics["completed_in_window"] == 4
+        assert metrics["measured_seconds"] < 5
+        assert metrics["throughput_per_second"] > 4 / 5
+    finally:
+        queue.close()
+
+
+def test_service_requires_its_token(tmp_path):
+    server = serve("127.0.0.1", 0, str(tmp_path), 1, ResourceLimits(), token="s3cret")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    body = {"template": "a\n", "table": "a\n1\n", "code": "def f(df):\n    return df"}
+    try:
+        assert _post(f"{base}/jobs", body)[0] == 401
+        assert _post(f"{base}/jobs", body, token="wrong")[0] == 401
+        assert _post(f"{base}/jobs", body, token="s3cret")[0] == 202
+        with urllib.request.urlopen(f"{base}/health") as response:
+            assert response.status == 200
+    finally:
+        server.shutdown()
+        server.pool.stop()
+        server.queue.close()
+
+
+def test_service_refuses_other_interfaces_without_a_token(tmp_path):
+    with pytest.raises(ValueError):
+        serve("0.0.0.0", 0, str(tmp_path), 1, ResourceLimits())
@@ -0,0 +1,58 @@
+import threading
+
+import pandas as pd
+
+from smart_map.core.mapping import convert_table, create_function_from_string
+
+
+def test_generated_code_uses_pandas_without_importing_it():
+    code = """
+def convert(df):
+    out = pd.DataFrame()
+    out["EffectiveDate"] = pd.to_datetime(df["start"]).dt.strftime("%Y-%m-%d")
+    out["Premium"] = np.round(df["premium"], 1)
+    return out
+"""
+    table = pd.DataFrame({"start": ["01/02/2023"], "premium": [12.34]})
+
+    converted = convert_table(create_function_from_string(code), table)
+
+    assert converted["EffectiveDate"].tolist() == ["2023-01-02"]
+    assert converted["Premium"].tolist() == [12.3]
+
+
+def test_generated_code_does_not_leak_into_module_globals():
+    create_function_from_string("def leaked(df):\n    return df\n")
+
+    import smart_map.core.mapping as mapping
+
+    assert not hasattr(mapping, "leaked")
+
+
+def test_concurrent_conversions_never_modify_the_shared_table():
+    shared = pd.DataFrame({"a": [1, 2, 3]})
+    quick_started, slow_started, quick_done = (threading.Event() for _ in range(3))
+
+    def quick(df):
+        quick_started.set()
+        slow_started.wait(5)
+        return df.assign(b=1)
+
+    def slow(df):
+        slow_started.set()
+        # Edits in place only after the other conversion has finished
+        quick_done.wait(5)
+        df.loc[0, "a"] = 999
+        return df
+
+    def run_quick():
+        convert_table(quick, shared)
+        quick_done.set()
+
+    quick_thread = threading.Thread(target=run_quick)
+    quick_thread.start()
+    quick_started.wait(5)
+    convert_table(slow, shared)
+    quick_thread.join()
+
+    assert shared["a"].tolist() == [1, 2, 3]
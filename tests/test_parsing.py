@@ -0,0 +1,80 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from types import GeneratorType
+
+import fitz
+import pytest
+
+import smart_map.core.parsing as parsing
+from smart_map.core.parsing import PdfFile, read_file
+
+
+def _pdf(pages: int) -> BytesIO:
+    pdf = fitz.open()
+    for i in range(pages):
+        page = pdf.new_page()
+        page.insert_text((72, 72), f"Page {i + 1} of the policy")
+        page.insert_text((72, 96), f"Clause {i + 1}.1 applies")
+    file = BytesIO(pdf.tobytes())
+    file.name = "policy.pdf"
+    return file
+
+
+def _expected(pages: int):
+    return [
+        f"Page {i + 1} of the policy\nClause {i + 1}.1 applies" for i in range(pages)
+    ]
+
+
+class _Pool(ProcessPoolExecutor):
+    def __init__(self):
+        super().__init__(3, mp_context=multiprocessing.get_context("fork"))
+        self.tasks = 0
+
+    def map(self, fn, *iterables, **kwargs):
+        iterables = [list(i) for i in iterables]
+        self.tasks += len(iterables[0])
+        return super().map(fn, *iterables, **kwargs)
+
+
+@pytest.fixture
+def parallel_pages(monkeypatch):
+    pool = _Pool()
+    monkeypatch.setattr(parsing, "_page_pool", lambda: pool)
+    monkeypatch.setattr(parsing, "PAGE_WORKERS", 3)
+    monkeypatch.setattr(parsing, "PARALLEL_MIN_PAGES", 8)
+    monkeypatch.setattr(parsing, "PAGES_PER_TASK", 3)
+    yield pool
+    pool.shutdown()
+
+
+def test_parallel_extraction_keeps_page_order(parallel_pages):
+    docs = list(PdfFile.iter_docs(_pdf(40)))
+
+    assert parallel_pages.tasks == 14
+    assert [doc.page_content for doc in docs] == _expected(40)
+    assert [doc.metadata["page"] for doc in docs] == list(range(1, 41))
+
+
+def test_small_pdfs_are_extracted_in_process(parallel_pages):
+    docs = list(PdfFile.iter_docs(_pdf(5)))
+
+    assert parallel_pages.tasks == 0
+    assert [doc.page_content for doc in docs] == _expected(5)
+
+
+def test_read_file_streams_pages_without_caching(parallel_pages):
+    file = _pdf(20)
+    stream = read_file(file, stream=True)
+
+    assert isinstance(stream, GeneratorType)
+    streamed = list(stream)
+    assert parallel_pages.tasks == 7
+    read = read_file(file)
+
+    assert [doc.page_content for doc in streamed] == _expected(20)
+    assert [doc.page_content for doc in read.docs] == _expected(20)
+    assert read.name == "policy.pdf"
+    assert read_file(file) is read
+    assert read_file(file, stream=True) is not stream
@@ -0,0 +1,97 @@
+from typing import Dict, List
+
+import pytest
+from langchain.docstore.document import Document
+
+import smart_map.core.qa as qa
+from smart_map.core.debug import FakeEmbeddings, FakeVectorStore
+from smart_map.core.embedding import FolderIndex
+from smart_map.core.parsing import TxtFile
+
+
+def _file(file_id: str, sources: Dict[str, str]) -> TxtFile:
+    docs = [
+        Document(page_content=text, metadata={"source": source})
+        for source, text in sources.items()
+    ]
+    return TxtFile(name=f"{file_id}.txt", id=file_id, docs=docs)
+
+
+def _index(*files: TxtFile) -> FolderIndex:
+    return FolderIndex.from_files(list(files), FakeEmbeddings(), FakeVectorStore)
+
+
+def _texts(docs: List[Document]) -> List[str]:
+    return [doc.page_content for doc in docs]
+
+
+@pytest.fixture
+def chains(monkeypatch):
+    """Counts the chains query_folder builds, one per answer it computes"""
+    built = []
+    create_chain = qa._create_chain
+
+    def counting_create_chain(model, **model_kwargs):
+        built.append(model)
+        return create_chain(model, **model_kwargs)
+
+    monkeypatch.setattr(qa, "_create_chain", counting_create_chain)
+    qa._answers.clear()
+    yield built
+    qa._answers.clear()
+
+
+def test_get_sources_returns_the_cited_documents_in_citation_order():
+    folder_index = _index(
+        _file("a", {"1": "one", "2": "two", "5": "five"}),
+        _file("b", {"2": "two again"}),
+    )
+
+    sources = qa.get_sources("It is. SOURCES: 2, 1, 2, 9", folder_index)
+
+    assert _texts(sources) == ["two", "two again", "one"]
+
+
+def test_query_folder_returns_the_sources_the_debug_model_cites(chains):
+    # The debug model always answers citing sources 1, 2, 3 and 4
+    folder_index = _index(_file("a", {"1": "one", "2": "two", "5": "five"}))
+
+    answer = qa.query_folder("question", folder_index, model="debug")
+
+    assert answer.answer == "The answer is 42. "
+    assert _texts(answer.sources) == ["one", "two"]
+
+
+def test_answers_are_cached_until_the_index_changes(chains):
+    folder_index = _index(_file("a", {"1": "one"}))
+
+    first = qa.query_folder("question", folder_index, model="debug")
+    assert qa.query_folder("question", folder_index, model="debug") is first
+    assert len(chains) == 1
+
+    qa.query_folder("other question", folder_index, model="debug")
+    assert len(chains) == 2
+
+    folder_index.add_files([_file("b", {"2": "two"})])
+    after_add = qa.query_folder("question", folder_index, model="debug")
+    assert len(chains) == 3
+    assert _texts(after_add.sources) == ["one", "two"]
+
+    folder_index.remove_files(["a"])
+    after_remove = qa.query_folder("question", folder_index, model="debug")
+    assert len(chains) == 4
+    assert _texts(after_remove.sources) == ["two"]
+
+
+def test_indexes_at_the_same_version_do_not_share_answers(chains):
+    first = _index(_file("a", {"1": "one"}))
+    second = _index(_file("b", {"2": "two"}))
+    assert first.version == second.version
+
+    assert _texts(qa.query_folder("question", first, model="debug").sources) == [
+        "one"
+    ]
+    assert _texts(qa.query_folder("question", second, model="debug").sources) == [
+        "two"
+    ]
+    assert len(chains) == 2
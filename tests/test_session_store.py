@@ -0,0 +1,99 @@
+import os
+
+import pandas as pd
+from streamlit.runtime.uploaded_file_manager import UploadedFile, UploadedFileRec
+
+from smart_map.core.session_store import SessionStore, SessionView
+
+MB = 1024**2
+
+
+def _frame(rows: int) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "policy": pd.Series([f"AB-{i:06d}" for i in range(rows)]),
+            "state": pd.Categorical(["CA", "NY", "TX", "WA"] * (rows // 4)),
+            "age": pd.Series(range(rows), dtype="int32"),
+            "claims": pd.array([None, 1, 2, 3] * (rows // 4), dtype="Int64"),
+            "premium": pd.Series(range(rows), dtype="float64") + 0.25,
+            "start": pd.date_range("2020-01-01", periods=rows, freq="h"),
+        }
+    )
+
+
+def test_spilled_frame_is_reloaded_with_its_dtypes(tmp_path):
+    store = SessionStore(max_session_bytes=MB, min_spill_bytes=0, spill_dir=tmp_path)
+    session = SessionView(store, "s")
+    frame = _frame(40_000)
+
+    session["converted"] = frame
+    session["other"] = _frame(40_000)
+
+    assert store.stats.spills == 1
+    assert os.listdir(tmp_path) == ["s-converted.arrow"]
+    reloaded = session["converted"]
+    assert store.stats.reloads == 1
+    pd.testing.assert_frame_equal(reloaded, frame)
+
+
+def test_upload_is_sized_by_its_contents_and_spilled(tmp_path):
+    store = SessionStore(max_session_bytes=MB, min_spill_bytes=0, spill_dir=tmp_path)
+    session = SessionView(store, "s")
+    data = b"policy\n" + b"AB-000001\n" * (MB // 5)
+    upload = UploadedFile(
+        UploadedFileRec(id=3, name="b.csv", type="text/csv", data=data)
+    )
+
+    session["table_b"] = upload
+    session["chain_output"] = {"code": "def f(df):\n    return df\n"}
+    session["converted"] = _frame(40_000)
+
+    assert store.stats.spills >= 1
+    assert session["table_b"].getvalue() == data
+
+
+def test_shared_values_are_not_counted_or_spilled(tmp_path):
+    store = SessionStore(max_session_bytes=MB, min_spill_bytes=0, spill_dir=tmp_path)
+    session = SessionView(store, "s")
+    template = "x" * (4 * MB)
+
+    session.share("template", template)
+    session["converted"] = _frame(100)
+
+    assert store.session_nbytes("s") < MB
+    assert store.stats.spills == 0
+    assert session["template"] is template
+
+
+def test_idle_sessions_are_dropped_with_their_spill_files(tmp_path):
+    store = SessionStore(
+        max_session_bytes=MB, min_spill_bytes=0, idle_timeout=60, spill_dir=tmp_path
+    )
+    idle, active = SessionView(store, "idle"), SessionView(store, "active")
+    idle["a"] = _frame(40_000)
+    idle["b"] = _frame(40_000)
+    assert os.listdir(tmp_path)
+
+    store._last_access["idle"] -= 120
+    active["a"] = _frame(4)
+
+    assert "a" not in idle
+    assert os.listdir(tmp_path) == []
+    assert store.stats.evicted_sessions == 1
+    assert store.stats.resident_bytes == store.session_nbytes("active")
+    assert store.stats.spilled_bytes == 0
+
+
+def test_values_that_cannot_be_spilled_stay_resident(tmp_path):
+    store = SessionStore(max_session_bytes=MB, min_spill_bytes=0, spill_dir=tmp_path)
+    session = SessionView(store, "s")
+    duplicated = pd.concat([_frame(40_000), _frame(40_000)], axis=1)
+
+    session["duplicated"] = duplicated
+    for i in range(3):
+        session[f"converted{i}"] = _frame(40_000)
+
+    assert session["duplicated"] is duplicated
+    assert not store._sessions["s"]["duplicated"].spillable
+    assert "s-duplicated.arrow" not in os.listdir(tmp_path)
+    assert store.stats.spills >= 1
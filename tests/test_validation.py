@@ -0,0 +1,97 @@
+import pandas as pd
+
+from smart_map.core.validation import infer_rules, validate_against_template
+
+NAMES = [
+    "Jennifer Lopez",
+    "Al Wu",
+    "Bartholomew Kingsley",
+    "José Núñez",
+    "Li Na",
+    "Maximilian Oberhauser",
+]
+
+
+def test_small_template_does_not_flag_ordinary_values():
+    template = pd.DataFrame(
+        {"Name": ["John Smith", "Jane Doe"], "Premium": [1200.5, 1250.0]}
+    )
+    converted = pd.DataFrame(
+        {"Name": NAMES, "Premium": [80.0, 1199.99, 5400.0, 999.0, 15000.0, 0.0]}
+    )
+
+    report = validate_against_template(template, converted)
+
+    assert report.ok, report.summary()
+
+
+def test_single_row_template_has_no_range():
+    template = pd.DataFrame({"Premium": [1000]})
+
+    (rule,) = infer_rules(template)
+
+    assert rule.min_value is None and rule.max_value is None
+
+
+def test_pattern_allows_other_lengths_of_the_same_shape():
+    template = pd.DataFrame({"PolicyNumber": [f"AB{i:04d}" for i in range(12)]})
+    converted = pd.DataFrame({"PolicyNumber": ["XYZ123456", "Q1", "AB-12"]})
+
+    report = validate_against_template(template, converted)
+
+    assert report.columns["PolicyNumber"].violations == {"pattern": 1}
+    assert report.columns["PolicyNumber"].samples == [2]
+
+
+def test_range_is_checked_for_templates_with_enough_values():
+    template = pd.DataFrame({"Age": list(range(20, 60, 4))})
+    converted = pd.DataFrame({"Age": [18, 45, 70, 500]})
+
+    report = validate_against_template(template, converted)
+
+    assert report.columns["Age"].violations == {"range": 1}
+
+
+def test_empty_frame_with_wrong_columns_is_not_ok():
+    template = pd.DataFrame({"Name": ["John Smith"], "Premium": [1200.5]})
+    converted = pd.DataFrame(columns=["name", "premium"])
+
+    report = validate_against_template(template, converted)
+
+    assert not report.ok
+    assert report.missing_columns == ["Name", "Premium"]
+    assert report.extra_columns == ["name", "premium"]
+
+
+def test_no_chunks_means_every_column_is_missing():
+    template = pd.DataFrame({"Name": ["John Smith"]})
+
+    report = validate_against_template(template, iter([]))
+
+    assert report.missing_columns == ["Name"]
+    assert not report.ok
+
+
+def test_empty_frame_with_template_columns_is_ok():
+    template = pd.DataFrame({"Name": ["John Smith"], "Premium": [1200.5]})
+    converted = pd.DataFrame(columns=["Name", "Premium"])
+
+    assert validate_against_template(template, converted).ok
+
+
+def test_duplicate_columns_are_reported_and_first_occurrence_checked():
+    template = pd.DataFrame({"Name": ["John Smith"], "Premium": [1200.5]})
+    converted = pd.concat(
+        [
+            pd.DataFrame({"Name": ["Al Wu", "Li Na"], "Premium": ["n/a", 10.0]}),
+            pd.DataFrame({"Premium": [1.0, 2.0]}),
+        ],
+        axis=1,
+    )
+
+    report = validate_against_template(template, converted)
+
+    assert not report.ok
+    assert report.duplicate_columns == ["Premium"]
+    assert report.extra_columns == []
+    assert report.columns["Premium"].violations == {"dtype": 1}